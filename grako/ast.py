@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 """
 Define the AST class, a direct descendant of dict that's used during parsing
-to store the values of named elements of grammar rules.
+to store the values of named elements of grammar rules, CompactAST, a
+smaller and faster alternative with the same semantics, and TypedAST, the
+base of the node classes that can be generated for each rule.
 """
 from __future__ import print_function, division, absolute_import, unicode_literals
+from collections import OrderedDict
+from .util import strtype
 
-__all__ = ['AST']
+__all__ = ['AST', 'CompactAST', 'TypedAST']
 
 
 class AST(dict):
@@ -66,3 +70,272 @@ class AST(dict):
 
     def add_list(self, key, value):
         return self.add(key, value, force_list=True)
+
+    def _extend(self, key, values):
+        # add the values under key as a list, extending the list in place
+        # if there is one
+        previous = self[key]
+        if previous is None:
+            super(AST, self).__setitem__(key, values)
+        elif isinstance(previous, list):
+            previous.extend(values)
+        else:
+            super(AST, self).__setitem__(key, [previous] + values)
+        return self
+
+    def _map(self, f):
+        # replace each value with f(value)
+        for key, value in list(dict.items(self)):
+            super(AST, self).__setitem__(key, f(value))
+        return self
+
+
+class CompactAST(object):
+    """
+    An AST with the semantics of AST for named elements, that keeps the
+    values in a list indexed by name. Each tuple of names in the order
+    they were added has a subclass of its own, shared by all the nodes
+    with those names, which reads them as properties. Names that clash
+    with methods must be read as items, and names are set with add() or
+    item assignment.
+    """
+    __slots__ = ('_values',)
+    _keys = ()
+
+    # (shape, name) -> the shape with name added
+    _shapes = {}
+
+    def __init__(self, *args, **kwargs):
+        self._values = []
+        for key, value in dict(*args, **kwargs).items():
+            self.add(key, value)
+
+    @staticmethod
+    def _shape(shape, key):
+        result = CompactAST._shapes.get((shape, key))
+        if result is None:
+            keys = shape._keys + (key,)
+            attrs = dict(__slots__=(), _keys=keys)
+            for i, name in enumerate(keys):
+                if isinstance(name, strtype) and not hasattr(CompactAST, name):
+                    attrs[str(name)] = property(lambda self, i=i: self._values[i])
+            result = type(str('CompactAST'), (CompactAST,), attrs)
+            CompactAST._shapes[(shape, key)] = result
+        return result
+
+    def add(self, key, value, force_list=False):
+        keys = self._keys
+        if key in keys:
+            i = keys.index(key)
+            previous = self._values[i]
+            if previous is None:
+                self._values[i] = [value] if force_list else value
+            elif isinstance(previous, list):
+                previous.append(value)
+            else:
+                self._values[i] = [previous, value]
+            return self
+        self.__class__ = self._shape(self.__class__, key)
+        self._values.append([value] if force_list else value)
+        return self
+
+    def add_list(self, key, value):
+        return self.add(key, value, force_list=True)
+
+    def _extend(self, key, values):
+        keys = self._keys
+        if key not in keys:
+            return self.add(key, values)
+        i = keys.index(key)
+        previous = self._values[i]
+        if previous is None:
+            self._values[i] = values
+        elif isinstance(previous, list):
+            previous.extend(values)
+        else:
+            self._values[i] = [previous] + values
+        return self
+
+    def _map(self, f):
+        self._values[:] = [f(value) for value in self._values]
+        return self
+
+    def __getitem__(self, key):
+        keys = self._keys
+        if key in keys:
+            return self._values[keys.index(key)]
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name == '_values':
+            raise AttributeError(name)
+        return self[name]
+
+    def __setitem__(self, key, value):
+        self.add(key, value)
+
+    def __delitem__(self, key):
+        keys = self._keys
+        if key not in keys:
+            raise KeyError(key)
+        values = self._values
+        del values[keys.index(key)]
+        shape = CompactAST
+        for k in keys:
+            if k != key:
+                shape = self._shape(shape, k)
+        self.__class__ = shape
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def get(self, key, default=None):
+        keys = self._keys
+        if key in keys:
+            return self._values[keys.index(key)]
+        return default
+
+    def keys(self):
+        return list(self._keys)
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return list(zip(self._keys, self._values))
+
+    def copy(self):
+        result = CompactAST.__new__(self.__class__)
+        result._values = list(self._values)
+        return result
+
+    def __reduce__(self):
+        # the shapes are not importable
+        return (CompactAST, (), self.items())
+
+    def __setstate__(self, items):
+        for key, value in items:
+            self.add(key, value)
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            # names in an AST hide its methods
+            return dict(self.items()) == dict(dict.items(other))
+        elif isinstance(other, CompactAST):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, dict(self.items()))
+
+
+class TypedAST(object):
+    """
+    The base of the node classes generated for the rules with named
+    elements, which list the names as their __slots__. Names that were
+    not matched, or that the rule doesn't have, are None, and add() and
+    item access have the semantics they have for AST.
+    """
+    __slots__ = ('parseinfo',)
+
+    def __init__(self, **kwargs):
+        self.parseinfo = None
+        for name in self.__slots__:
+            setattr(self, name, None)
+        for name, value in kwargs.items():
+            self.add(name, value)
+
+    def add(self, key, value, force_list=False):
+        previous = getattr(self, key)
+        if previous is None:
+            setattr(self, key, [value] if force_list else value)
+        elif isinstance(previous, list):
+            previous.append(value)
+        else:
+            setattr(self, key, [previous, value])
+        return self
+
+    def add_list(self, key, value):
+        return self.add(key, value, force_list=True)
+
+    def _extend(self, key, values):
+        previous = getattr(self, key)
+        if previous is None:
+            setattr(self, key, values)
+        elif isinstance(previous, list):
+            previous.extend(values)
+        else:
+            setattr(self, key, [previous] + values)
+        return self
+
+    def _map(self, f):
+        for name in self.__slots__:
+            setattr(self, name, f(getattr(self, name)))
+        return self
+
+    def __getitem__(self, key):
+        return getattr(self, key, None)
+
+    def __getattr__(self, name):
+        # names the rule doesn't have read as None, as with AST
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return None
+
+    def __setitem__(self, key, value):
+        self.add(key, value)
+
+    def __contains__(self, key):
+        return getattr(self, key, None) is not None
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __bool__(self):
+        # empty, as an AST with no names, until a name is matched
+        return any(getattr(self, name) is not None for name in self.__slots__)
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def keys(self):
+        return list(self.__slots__)
+
+    def values(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.__slots__]
+
+    def asjson(self):
+        # for json.dumps(ast, default=TypedAST.asjson), which calls it for
+        # the nested nodes too
+        return OrderedDict(self.items())
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.items() == other.items()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ', '.join('%s=%r' % item for item in self.items())
+        return '%s(%s)' % (self.__class__.__name__, fields)
@@ -250,8 +250,19 @@ class GrakoParserBase(Parser):
     def expre(self):
         self.choice()
 
+    @rule_def
+    def decorator(self):
+        self._token('@')
+        self._cut()
+        self._token('nomemo', '@')
+
     @rule_def
     def rule(self):
+        def block():
+            self.decorator()
+            self.ast.add_list('decorators', self.last_node)
+        self._closure(block)
+
         self.word()
         self.ast['name'] = self.last_node
         self._cut()
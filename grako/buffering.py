@@ -4,24 +4,75 @@ The Buffer class provides the functionality required by a parser-driven lexer.
 
 Line analysis and caching are done so the parser can freely move with goto(p)
 to any position in the parsed text, and still recover accurate information
-about source lines and content.
+about source lines and content. The line index is built only when line
+information is first requested, so successful parses don't pay for it.
 """
 from __future__ import print_function, division, absolute_import, unicode_literals
-# TODO: There could be a file buffer using random access
+import os
+import mmap
 import re as regexp
 import string
-from bisect import bisect as bisect
+from array import array
+from bisect import bisect_left
 from collections import namedtuple
 
-__all__ = ['Buffer']
+__all__ = ['Buffer', 'FileBuffer', 'PatternRegistry', 'PATTERNS']
 
 RETYPE = type(regexp.compile('.'))
 
-PosLine = namedtuple('PosLine', ['pos', 'line'])
+
+class PatternRegistry(object):
+    """
+    Compiled regular expressions keyed by pattern and flags, shared by all
+    the buffers in the process. Generated parsers register their patterns
+    when their module is loaded, so parsing never pays for compilation.
+    """
+    def __init__(self):
+        self._compiled = {}
+
+    def compile(self, pattern, flags=0):
+        cache = self._compiled.get(flags)
+        if cache is None:
+            cache = self._compiled[flags] = {}
+        re = cache.get(pattern)
+        if re is None:
+            re = cache[pattern] = regexp.compile(pattern, flags)
+        return re
+
+    def register(self, *patterns):
+        for pattern in patterns:
+            self.compile(pattern)
+
+
+PATTERNS = PatternRegistry()
+
+# Per-token metadata used by Buffer.match(), computed once per distinct
+# token: (length, lowercased token, whether the nameguard applies).
+TOKEN_INFO = {}
+
+# Maximum number of positions remembered by Buffer.next_token(). Parsers
+# backtrack over a window near the current position, so the cache is
+# simply dropped when it grows past this size.
+SKIP_CACHE_SIZE = 4096
+
+# The inline flags a pattern may start with, such as (?m) or (?s). They
+# must stay at the start of the patterns the comments are embedded in.
+INLINE_FLAGS_RE = regexp.compile(r'(?:\(\?[aiLmsux]+\))+')
+
+# The array type of line offsets, 64 bits even where longs are 32 bits
+# (as on Windows), for inputs past 2GB.
+try:
+    OFFSET_TYPE = str('q')
+    array(OFFSET_TYPE)
+except ValueError:  # Python 2 builds without long long
+    OFFSET_TYPE = str('l')
+
 LineInfo = namedtuple('LineInfo', ['filename', 'line', 'col', 'start', 'text'])
 
 
 class Buffer(object):
+    _newline = '\n'
+
     def __init__(self, text,
                  filename=None,
                  whitespace=None,
@@ -40,15 +91,16 @@ class Buffer(object):
         self.ignorecase = ignorecase
         self.trace = trace
         self.nameguard = nameguard
-        self._fileinfo = self.get_fileinfo(text, filename)
-        self._linecache = []
-        self._linecount = 0
+        self._fileinfo = None
+        self._linecache = None
         self._pos = 0
         self._len = 0
         self._preprocess()
-        self._build_line_cache()
         self._len = len(self.text)
-        self._re_cache = {}
+        self._skip_cache = {}
+        self._folded_text = None
+        self.skip_cache_hits = 0
+        self._build_skip_res()
 
     def _preprocess(self):
         pass
@@ -63,14 +115,11 @@ class Buffer(object):
 
     @property
     def line(self):
-        n = bisect(self._linecache, PosLine(self._pos, 0))
-        return self._linecache[n - 1][1]
+        return self._line_at(self._pos)
 
     @property
     def col(self):
-        n = bisect(self._linecache, PosLine(self._pos, 0))
-        start = self._linecache[n - 1][0]
-        return self._pos - start - 1
+        return self._pos - self._lines()[self.line] - 1
 
     def atend(self):
         return self._pos >= self._len
@@ -96,26 +145,78 @@ class Buffer(object):
     def move(self, n):
         self.goto(self.pos + n)
 
+    def _compile(self, pattern, flags=0):
+        return PATTERNS.compile(pattern, flags)
+
+    def _regex(self, pattern, ignorecase):
+        flags = regexp.IGNORECASE if ignorecase else 0
+        if isinstance(pattern, RETYPE):
+            if not flags & ~pattern.flags:
+                return pattern
+            pattern, flags = pattern.pattern, pattern.flags | flags
+        return self._compile(pattern, flags)
+
+    def _build_skip_res(self):
+        # Whitespace and comments are compiled into regular expressions
+        # once, and next_token() skips over any mix of them with a single
+        # match instead of iterating until the position stops moving.
+        ws = self._whitespace_pattern()
+        comments = self.comments_re or None
+        inline_flags = ''
+        if comments:
+            inline_flags = INLINE_FLAGS_RE.match(comments)
+            inline_flags = inline_flags.group() if inline_flags else ''
+            comments = '(?:%s)' % comments[len(inline_flags):]
+        flags = regexp.MULTILINE if comments and '\n' in comments else 0
+
+        def skipper(*options):
+            options = [o for o in options if o is not None]
+            if options:
+                return self._compile('%s(?:%s)*' % (inline_flags, '|'.join(options)), flags)
+
+        self._whitespace_re = skipper(ws)
+        self._comments_re = skipper(comments)
+        self._skip_re = skipper(ws, comments)
+        # subclasses that skip in their own way are called as they were
+        # before the skip regex
+        cls = type(self)
+        self._skip_methods = (cls.eatwhitespace != Buffer.eatwhitespace or
+                              cls.eatcomments != Buffer.eatcomments)
+
+    def _whitespace_pattern(self):
+        ws = ''.join(regexp.escape(c) for c in sorted(self.whitespace))
+        return '[%s]+' % ws if ws else None
+
+    def _skip(self, re):
+        if re is not None:
+            self._pos = re.match(self.text, self._pos).end()
+
     def eatwhitespace(self):
-        p = self._pos
-        le = self._len
-        ws = self.whitespace
-        while p < le and self.text[p] in ws:
-            p += 1
-        self._pos = p
+        self._skip(self._whitespace_re)
 
     def eatcomments(self):
-        if self.comments_re is not None:
-            opts = regexp.MULTILINE if '\n' in self.comments_re else 0
-            while self.matchre(self.comments_re, opts):
-                pass
+        self._skip(self._comments_re)
 
     def next_token(self):
-        p = None
-        while self._pos != p:
-            p = self._pos
-            self.eatwhitespace()
-            self.eatcomments()
+        if self._skip_methods:
+            p = None
+            while self._pos != p:
+                p = self._pos
+                self.eatwhitespace()
+                self.eatcomments()
+            return
+        # The text doesn't change, so where a position skips to is
+        # remembered for the many times backtracking comes back to it.
+        p = self._pos
+        cache = self._skip_cache
+        if p in cache:
+            self._pos = cache[p]
+            self.skip_cache_hits += 1
+            return
+        self._skip(self._skip_re)
+        if len(cache) >= SKIP_CACHE_SIZE:
+            cache.clear()
+        cache[p] = self._pos
 
     def skip_to(self, c):
         p = self._pos
@@ -134,68 +235,91 @@ class Buffer(object):
     def is_space(self):
         return self.current() in self.whitespace
 
-    def match(self, token, ignorecase=None):
-        ignorecase = ignorecase if ignorecase is not None else self.ignorecase
+    def _folded(self):
+        # A lowercased copy of the text for case-insensitive matching. It
+        # can't be used if lowercasing changed the length of the text.
+        if self._folded_text is None:
+            folded = self.text.lower()
+            self._folded_text = folded if len(folded) == self._len else False
+        return self._folded_text
 
+    def match(self, token, ignorecase=None):
         if token is None:
             return self.atend()
 
-        p = self.pos
-        if ignorecase:
-            result = self.text[p:p + len(token)].lower() == token.lower()
+        info = TOKEN_INFO.get(token)
+        if info is None:
+            info = TOKEN_INFO[token] = (len(token), token.lower(), token.isalnum())
+        length, lowered, alnum = info
+
+        p = self._pos
+        if ignorecase or ignorecase is None and self.ignorecase:
+            folded = self._folded()
+            if folded:
+                result = folded.startswith(lowered, p)
+            else:
+                result = self.text[p:p + length].lower() == lowered
         else:
-            result = self.text[p:p + len(token)] == token
+            result = self.text.startswith(token, p)
 
         if result:
-            self.move(len(token))
-            check_nameguard = not (self.nameguard and token.isalnum() and self.current().isalnum())
-            if check_nameguard:
+            p += length
+            if not (alnum and self.nameguard and p < self._len and self.text[p].isalnum()):
+                self._pos = p
                 return token
-        self.goto(p)
 
     def matchre(self, pattern, ignorecase=None):
         ignorecase = ignorecase if ignorecase is not None else self.ignorecase
 
-        if isinstance(pattern, RETYPE):
-            re = pattern
-        elif pattern in self._re_cache:
-            re = self._re_cache[pattern]
-        else:
-            re = regexp.compile(pattern, regexp.IGNORECASE if ignorecase else 0)
-            self._re_cache[re] = re
-
-        matched = re.match(self.text, self.pos)
+        matched = self._regex(pattern, ignorecase).match(self.text, self._pos)
         if matched:
-            token = matched.group()
-            self._pos += len(token)
-            return token
+            self._pos = matched.end()
+            return matched.group()
+
+    @property
+    def fileinfo(self):
+        if self._fileinfo is None:
+            self._fileinfo = self.get_fileinfo(self.original_text, self.filename)
+        return self._fileinfo
 
     def get_fileinfo(self, text, filename):
         return [filename] * len(text.splitlines())
 
     def _build_line_cache(self):
-        cache = [PosLine(-1, 0)]
-        n = 0
-        for i, c in enumerate(self.text):
-            if c == '\n':
-                n += 1
-                cache.append(PosLine(i, n))
-        cache.append(PosLine(len(self.text), n + 1))
+        # The cache holds the offset of every newline, with -1 before the
+        # first line and the length of the text after the last one, so
+        # line n spans the text between entries n and n + 1.
+        newline = self._newline
+        find = self.text.find
+        cache = array(OFFSET_TYPE, [-1])
+        i = find(newline)
+        while i >= 0:
+            cache.append(i)
+            i = find(newline, i + 1)
+        cache.append(self._len)
         self._linecache = cache
-        self._linecount = n
+
+    def _lines(self):
+        if self._linecache is None:
+            self._build_line_cache()
+        return self._linecache
+
+    def _line_at(self, pos):
+        return bisect_left(self._lines(), pos) - 1
 
     @property
     def linecount(self):
-        return self._linecount
+        return len(self._lines()) - 2
 
     def line_info(self, pos=None):
         if pos is None:
             pos = self.pos
-        n = bisect(self._linecache, PosLine(pos, 0))
-        start, line = self._linecache[n - 1]
+        lines = self._lines()
+        line = self._line_at(pos)
+        start = lines[line]
         col = pos - start - 1
         start = max(0, start)
-        end = max(start, self._linecache[n].pos)
+        end = max(start, lines[line + 1])
         text = self.text[start:end]
         return LineInfo(self.filename, line, col, start, text)
 
@@ -210,7 +334,146 @@ class Buffer(object):
     def get_line(self, n=None):
         if n is None:
             n = self.line
-        start, line = self._linecache[n][:2]
-        assert line == n
-        end, _ = self._linecache[n + 1]
-        return self.text[start + 1:end]
+        lines = self._lines()
+        return self.text[lines[n] + 1:lines[n + 1]]
+
+
+class FileBuffer(Buffer):
+    """
+    A Buffer that parses directly over a memory-mapped file, so the input
+    is never read into memory as a whole.
+
+    Positions are byte offsets into the file, and tokens and patterns are
+    matched against the encoded bytes, so only ASCII and UTF-8 inputs are
+    supported. Matched tokens and line information are decoded on demand.
+    """
+    _newline = b'\n'
+
+    def __init__(self, filename, encoding='utf-8', **kwargs):
+        self.encoding = encoding
+        self._file = open(filename, 'rb')
+        if os.fstat(self._file.fileno()).st_size:
+            text = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            text = b''  # empty files cannot be mapped
+        self._bytes_re_cache = {}
+        super(FileBuffer, self).__init__(text, filename=filename, **kwargs)
+
+    def close(self):
+        if isinstance(self.text, mmap.mmap):
+            self.text.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _compile(self, pattern, flags=0):
+        if not isinstance(pattern, bytes):
+            pattern = pattern.encode(self.encoding)
+        return PATTERNS.compile(pattern, flags & ~regexp.UNICODE)
+
+    def _regex(self, pattern, ignorecase):
+        key = (pattern, ignorecase)
+        re = self._bytes_re_cache.get(key)
+        if re is None:
+            if isinstance(pattern, RETYPE):
+                source, flags = pattern.pattern, pattern.flags
+            else:
+                source, flags = pattern, 0
+            if ignorecase:
+                flags |= regexp.IGNORECASE
+            re = self._bytes_re_cache[key] = self._compile(source, flags)
+        return re
+
+    def _whitespace_pattern(self):
+        # Non-ASCII whitespace is matched by the bytes of each character
+        # in sequence, as a class would match any of the bytes alone.
+        ws = sorted(self.whitespace)
+        ascii = ''.join(regexp.escape(c) for c in ws if ord(c) < 128)
+        options = ['[%s]' % ascii] if ascii else []
+        options.extend(regexp.escape(c) for c in ws if ord(c) >= 128)
+        return '(?:%s)+' % '|'.join(options) if options else None
+
+    def _decode(self, data):
+        return data.decode(self.encoding, 'replace')
+
+    def _charlen(self, p):
+        lead = ord(self.text[p:p + 1])
+        if lead < 0xC0:
+            return 1
+        elif lead < 0xE0:
+            return 2
+        elif lead < 0xF0:
+            return 3
+        return 4
+
+    @property
+    def col(self):
+        return self.line_info().col
+
+    def current(self):
+        if self._pos >= self._len:
+            return None
+        p = self._pos
+        return self._decode(self.text[p:p + self._charlen(p)])
+
+    def next(self):
+        c = self.current()
+        if c is not None:
+            self._pos += self._charlen(self._pos)
+        return c
+
+    def skip_to(self, c):
+        p = self.text.find(c.encode(self.encoding), self._pos)
+        self._pos = p if p >= 0 else self._len
+
+    def match(self, token, ignorecase=None):
+        ignorecase = ignorecase if ignorecase is not None else self.ignorecase
+
+        if token is None:
+            return self.atend()
+
+        p = self._pos
+        if ignorecase:
+            # compare characters, as Buffer does, as bytes.lower() only
+            # folds ASCII
+            text = self._decode(self.text[p:p + 4 * len(token)])[:len(token)]
+            result = text.lower() == token.lower()
+            length = len(text.encode(self.encoding))
+        else:
+            btoken = token.encode(self.encoding)
+            result = self.text[p:p + len(btoken)] == btoken
+            length = len(btoken)
+
+        if result:
+            self.goto(p + length)
+            c = self.current()
+            if not (self.nameguard and token.isalnum() and c is not None and c.isalnum()):
+                return token
+        self.goto(p)
+
+    def matchre(self, pattern, ignorecase=None):
+        token = super(FileBuffer, self).matchre(pattern, ignorecase)
+        if token is not None:
+            return self._decode(token)
+
+    def get_fileinfo(self, text, filename):
+        return None
+
+    def line_info(self, pos=None):
+        if pos is None:
+            pos = self.pos
+        lines = self._lines()
+        line = self._line_at(pos)
+        start = lines[line]
+        col = len(self._decode(self.text[start + 1:pos]))
+        start = max(0, start)
+        end = max(start, lines[line + 1])
+        text = self._decode(self.text[start:end])
+        return LineInfo(self.filename, line, col, start, text)
+
+    def get_line(self, n=None):
+        return self._decode(super(FileBuffer, self).get_line(n))
@@ -1,25 +1,352 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, division, absolute_import, unicode_literals
 import sys
+from timeit import default_timer as timer
 from functools import wraps
 from contextlib import contextmanager
-from collections import namedtuple
-from .util import to_list
-from .ast import AST
-from .exceptions import (FailedParse,
+from collections import namedtuple, OrderedDict
+from heapq import heapify, heappush, heappop
+from .util import to_list, strtype
+from .ast import AST, CompactAST, TypedAST
+from .buffering import FileBuffer
+from .exceptions import (FailedParseBase,
+                         FailedParse,
+                         FailedSemantics,
                          FailedCut,
                          FailedLookahead,
                          OptionSucceeded
                          )
 
 
-__all__ = ['ParseInfo', 'ParseContext']
+__all__ = ['ParseInfo', 'MemoStats', 'MemoFailure', 'NOCST', 'Deferred', 'ParseContext',
+           'RecognizerMixin', 'MemoCache', 'RuleMemoCache', 'MemoProfile']
 
 
 ParseInfo = namedtuple('ParseInfo', ['buffer', 'rule', 'pos', 'endpos'])
+MemoStats = namedtuple('MemoStats', ['hits', 'misses', 'evictions'])
+
+# What the memo cache keeps of a failed rule invocation: the type of the
+# failure, where it happened, what was expected, and whether it was cut.
+# Keeping the exception instead would keep its traceback and every frame
+# it references alive. Failures the context didn't build itself may take
+# other arguments, so a copy of them is kept as the item, with no type.
+MemoFailure = namedtuple('MemoFailure', ['etype', 'pos', 'item', 'cut'])
+
+# The CST of a rule whose CST is not being built, because the rule has
+# named elements and the context builds only ASTs for those, and of the
+# expressions in it whose CST no named element reads.
+NOCST = object()
+
+
+class MemoCache(object):
+    """
+    The packrat memoization table.
+
+    Results are kept in one bucket per input position, and a heap of the
+    positions with buckets lets cut() discard everything before a position
+    in time proportional to what is discarded.
+
+    When a *limit* on the number of entries is given, whole buckets are
+    evicted when the limit is exceeded: the ones for the lowest positions
+    with the 'window' policy, or the least recently used with 'lru'.
+    """
+    POLICIES = ('window', 'lru')
+
+    def __init__(self, limit=None, policy='window'):
+        if policy not in self.POLICIES:
+            raise ValueError('unknown memoization policy %r' % policy)
+        self.limit = limit
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.clear()
+
+    def __len__(self):
+        return self._size
+
+    def get(self, pos, key):
+        bucket = self._buckets.get(pos)
+        if bucket is not None:
+            result = bucket.get(key)
+            if result is not None:
+                self.hits += 1
+                if self._lru:
+                    del self._buckets[pos]
+                    self._buckets[pos] = bucket
+                return result
+        self.misses += 1
+
+    def set(self, pos, key, result):
+        bucket = self._buckets.get(pos)
+        if bucket is None:
+            bucket = self._buckets[pos] = {}
+            heappush(self._positions, pos)
+        if key not in bucket:
+            self._size += 1
+        bucket[key] = result
+        if self.limit is not None and self._size > self.limit:
+            self._evict()
+
+    def _evict(self):
+        buckets = self._buckets
+        while self._size > self.limit and buckets:
+            if self._lru:
+                _, bucket = buckets.popitem(last=False)
+            else:
+                bucket = buckets.pop(heappop(self._positions))
+            self._size -= len(bucket)
+            self.evictions += len(bucket)
+        if len(self._positions) > 2 * len(buckets):
+            self._positions = list(buckets)
+            heapify(self._positions)
+
+    def cut(self, pos):
+        buckets = self._buckets
+        positions = self._positions
+        while positions and positions[0] < pos:
+            # buckets evicted by the 'lru' policy leave their positions behind
+            bucket = buckets.pop(heappop(positions), None)
+            if bucket is not None:
+                self._size -= len(bucket)
+
+    def clear(self):
+        self._lru = self.policy == 'lru'
+        self._buckets = OrderedDict() if self._lru else {}
+        self._positions = []
+        self._size = 0
+
+
+class RuleMemoCache(MemoCache):
+    """
+    A MemoCache that keeps the results of each rule in a dict of its own,
+    keyed by position, instead of one dict per position keyed by rule.
+
+    Keys must be the dense integer ids of the rules, so a lookup is a list
+    index and an int-keyed dict lookup, and no container is allocated for
+    each position: the ids stored at a position are kept as the bits of an
+    int, so discarding a position visits only the dicts of those rules.
+    """
+    def __init__(self, rules=0, **kwargs):
+        self.rules = rules
+        super(RuleMemoCache, self).__init__(**kwargs)
+
+    def get(self, pos, key):
+        try:
+            result = self._rules[key].get(pos)
+        except IndexError:
+            result = None
+        if result is not None:
+            self.hits += 1
+            if self._lru:
+                self._live[pos] = self._live.pop(pos)
+            return result
+        self.misses += 1
+
+    def set(self, pos, key, result):
+        rules = self._rules
+        if key >= len(rules):
+            rules.extend({} for _ in range(key + 1 - len(rules)))
+        memo = rules[key]
+        if pos not in memo:
+            self._size += 1
+        memo[pos] = result
+        live = self._live
+        ids = live.get(pos)
+        if ids is None:
+            live[pos] = 1 << key
+            heappush(self._positions, pos)
+        else:
+            live[pos] = ids | 1 << key
+        if self.limit is not None and self._size > self.limit:
+            self._evict()
+
+    def _discard(self, pos):
+        ids = self._live.pop(pos)
+        rules = self._rules
+        discarded = 0
+        while ids:
+            bit = ids & -ids
+            del rules[bit.bit_length() - 1][pos]
+            ids ^= bit
+            discarded += 1
+        self._size -= discarded
+        return discarded
+
+    def _evict(self):
+        live = self._live
+        while self._size > self.limit and live:
+            if self._lru:
+                pos = next(iter(live))
+            else:
+                pos = heappop(self._positions)
+                if pos not in live:
+                    continue
+            self.evictions += self._discard(pos)
+        if len(self._positions) > 2 * len(live):
+            self._positions = list(live)
+            heapify(self._positions)
+
+    def cut(self, pos):
+        positions = self._positions
+        while positions and positions[0] < pos:
+            p = heappop(positions)
+            if p in self._live:
+                self._discard(p)
+
+    def clear(self):
+        self._lru = self.policy == 'lru'
+        self._rules = [{} for _ in range(self.rules)]
+        self._live = OrderedDict() if self._lru else {}
+        self._positions = []
+        self._size = 0
+
+
+class RuleMemoProfile(object):
+    def __init__(self, name):
+        self.name = name
+        self.stored = 0
+        self.reused = 0
+        self.bytes = 0
+        self.saved = 0.0
+
+
+class MemoProfile(object):
+    """
+    Statistics about how useful memoization is for each rule, accumulated
+    over any number of parses: the memos stored and reused, the memory
+    they held, and the time that reusing them saved.
+    """
+    def __init__(self):
+        self.rules = {}
+
+    def _rule(self, key):
+        if isinstance(key, strtype):
+            name = key
+        elif hasattr(key, '__name__'):
+            name = key.__name__.strip('_')
+        else:
+            name = str(key)
+        rule = self.rules.get(name)
+        if rule is None:
+            rule = self.rules[name] = RuleMemoProfile(name)
+        return rule
+
+    def stored(self, key, result):
+        rule = self._rule(key)
+        rule.stored += 1
+        rule.bytes += sys.getsizeof(result)
+        if isinstance(result, tuple) and not isinstance(result, MemoFailure):
+            rule.bytes += sys.getsizeof(result[0])
+
+    def reused(self, key, elapsed):
+        rule = self._rule(key)
+        rule.reused += 1
+        rule.saved += elapsed
+
+    def nomemo_rules(self, threshold=0.0):
+        """
+        The rules whose memos were reused no more than *threshold* times
+        per memo stored.
+        """
+        return sorted(r.name for r in self.rules.values()
+                      if r.stored and r.reused <= threshold * r.stored)
+
+    def report(self, threshold=0.0):
+        template = '%-30s %10s %10s %8s %12s %10s'
+        lines = [template % ('rule', 'stored', 'reused', 'reuse%', 'bytes', 'saved(s)')]
+        for r in sorted(self.rules.values(), key=lambda r: -r.saved):
+            reuse = '%.1f' % (100.0 * r.reused / r.stored) if r.stored else '-'
+            lines.append(template % (r.name, r.stored, r.reused, reuse, r.bytes, '%.4f' % r.saved))
+        nomemo = self.nomemo_rules(threshold)
+        if nomemo:
+            lines.append('')
+            lines.append('Rules that could be marked @nomemo:')
+            lines.extend('    ' + name for name in nomemo)
+        return '\n'.join(lines)
+
+
+class ProfilingMemoCache(MemoCache):
+    """
+    A MemoCache that records every memo stored and reused in a MemoProfile,
+    timing rule invocations from the memo miss to the result being stored.
+    Integer keys are reported as the corresponding *names*.
+    """
+    def __init__(self, profile, names=(), **kwargs):
+        super(ProfilingMemoCache, self).__init__(**kwargs)
+        self.profile = profile
+        self.names = names
+
+    def _name(self, key):
+        # keys the names don't cover, as from another parser, are
+        # reported as they are
+        if isinstance(key, int):
+            return self.names[key] if 0 <= key < len(self.names) else str(key)
+        return key
+
+    def get(self, pos, key):
+        result = super(ProfilingMemoCache, self).get(pos, key)
+        if result is None:
+            self._started[(pos, key)] = timer()
+        else:
+            self.profile.reused(self._name(key), self._elapsed.get((pos, key), 0.0))
+        return result
+
+    def set(self, pos, key, result):
+        started = self._started.pop((pos, key), None)
+        if started is not None:
+            self._elapsed[(pos, key)] = timer() - started
+        self.profile.stored(self._name(key), result)
+        super(ProfilingMemoCache, self).set(pos, key, result)
+
+    def clear(self):
+        super(ProfilingMemoCache, self).clear()
+        self._started = {}
+        self._elapsed = {}
+
+
+class ProfilingRuleMemoCache(ProfilingMemoCache, RuleMemoCache):
+    pass
+
+
+# The memo cache classes for each value of the memo_store parameter,
+# without and with profiling.
+MEMO_STORES = {
+    'position': (MemoCache, ProfilingMemoCache),
+    'rule': (RuleMemoCache, ProfilingRuleMemoCache),
+}
+
+
+class Choice(object):
+    """
+    The state of a choice being parsed. Options given the choice mark it as
+    done when they succeed, instead of raising OptionSucceeded, so the
+    parser can skip the remaining options with a simple test.
+    """
+    __slots__ = ('done',)
+
+    def __init__(self):
+        self.done = False
+
+
+class Deferred(object):
+    """
+    The result of a rule whose semantic action was deferred. The action
+    runs on node after the parse, if the result is part of the final tree,
+    and at most once, however many times the result was reused.
+    """
+    __slots__ = ('action', 'node', 'pos')
+
+    def __init__(self, action, node, pos):
+        self.action = action
+        self.node = node
+        self.pos = pos
 
 
 class ParseContext(object):
+    # The names of the rules, indexed by their integer ids.
+    _rule_names = ()
+
     def __init__(self,
                  buffer=None,
                  semantics=None,
@@ -27,6 +354,14 @@ class ParseContext(object):
                  trace=False,
                  encoding='utf-8',
                  comments_re=None,
+                 memoize=None,
+                 memo_limit=None,
+                 memo_policy='window',
+                 memo_profile=None,
+                 memo_store='position',
+                 ast_type=AST,
+                 ast_only=False,
+                 defer_semantics=False,
                  **kwargs):
         super(ParseContext, self).__init__()
 
@@ -36,13 +371,27 @@ class ParseContext(object):
         self.comments_re = comments_re
         self.parseinfo = parseinfo
         self.trace = trace
+        self.memoize = memoize
+        self.memo_limit = memo_limit
+        self.memo_policy = memo_policy
+        if memo_store not in MEMO_STORES:
+            raise ValueError('unknown memo store %r' % memo_store)
+        self.memo_store = memo_store
+        self.ast_type = ast_type
+        self.ast_only = ast_only
+        self.defer_semantics = defer_semantics
+        if memo_profile is True:
+            memo_profile = MemoProfile()
+        self.memo_profile = memo_profile
 
         self._ast_stack = []
         self._concrete_stack = [None]
         self._rule_stack = []
         self._cut_stack = [False]
-        self._memoization_cache = dict()
+        self._memo_keys = self._new_memo_keys()
+        self._memoization_cache = self._new_memo_cache()
         self._last_node = None
+        self._failures = {}
 
     def _reset_context(self, buffer=None, semantics=None):
         self._buffer = buffer
@@ -50,10 +399,43 @@ class ParseContext(object):
         self._concrete_stack = [None]
         self._rule_stack = []
         self._cut_stack = [False]
-        self._memoization_cache = dict()
+        self._memo_keys = self._new_memo_keys()
+        self._memoization_cache = self._new_memo_cache()
+        self._failures = {}
         if semantics is not None:
             self.semantics = semantics
 
+    def _new_memo_keys(self):
+        # the memo keys of the rules, indexed by rule id: the names for the
+        # position buckets, and the ids themselves for the rule dicts
+        if self.memo_store == 'rule':
+            return list(range(len(self._rule_names)))
+        return list(self._rule_names)
+
+    def _new_memo_cache(self):
+        cache, profiling = MEMO_STORES[self.memo_store]
+        kwargs = dict(limit=self.memo_limit, policy=self.memo_policy)
+        if self.memo_store == 'rule':
+            kwargs.update(rules=len(self._rule_names))
+        if self.memo_profile:
+            return profiling(self.memo_profile, names=self._rule_names, **kwargs)
+        return cache(**kwargs)
+
+    def _memoizes(self, name, default=True):
+        # memoize=None honors the grammar, True or False applies to all
+        # rules, and a dict overrides the grammar for the rules named in it
+        memoize = self.memoize
+        if memoize is None:
+            return default
+        elif isinstance(memoize, dict):
+            return memoize.get(name, default)
+        return bool(memoize)
+
+    @property
+    def memo_stats(self):
+        cache = self._memoization_cache
+        return MemoStats(cache.hits, cache.misses, cache.evictions)
+
     def goto(self, pos):
         self._buffer.goto(pos)
 
@@ -75,6 +457,17 @@ class ParseContext(object):
     def _next_token(self):
         self._buffer.next_token()
 
+    def _peek_char(self):
+        # The character the next token would start with, lowercased when
+        # the buffer ignores case, used to dispatch on choices.
+        p = self._pos
+        self._next_token()
+        c = self._buffer.current()
+        self._goto(p)
+        if c is not None and self._buffer.ignorecase:
+            c = c.lower()
+        return c
+
     @property
     def ast(self):
         return self._ast_stack[-1]
@@ -83,9 +476,9 @@ class ParseContext(object):
     def ast(self, value):
         self._ast_stack[-1] = value
 
-    def _push_ast(self):
-        self._push_cst()
-        self._ast_stack.append(AST())
+    def _push_ast(self, ast_type=None, cst=True):
+        self._push_cst(cst)
+        self._ast_stack.append((ast_type or self.ast_type)())
 
     def _pop_ast(self):
         self._pop_cst()
@@ -97,15 +490,19 @@ class ParseContext(object):
         return node
 
     def _update_ast(self, ast):
-        for key, value in ast.items():
-            if key not in self.ast or not isinstance(value, list):
-                self._add_ast_node(key, value)
+        # Merge the AST of an option or of a closure iteration into the
+        # enclosing one. Lists are taken over or extended in place, so the
+        # time is proportional to what is merged, not to what accumulated.
+        if not ast:
+            return
+        target = self.ast
+        # named elements hide the methods of an AST
+        items = dict.items(ast) if isinstance(ast, dict) else ast.items()
+        for key, value in items:
+            if isinstance(value, list):
+                target._extend(key, value)
             else:
-                prev = self.ast[key]
-                if isinstance(prev, list):
-                    prev.extend(value)
-                else:
-                    self.ast[key] = [prev] + value
+                target.add(key, value)
 
     @property
     def cst(self):
@@ -115,8 +512,13 @@ class ParseContext(object):
     def cst(self, value):
         self._concrete_stack[-1] = value
 
-    def _push_cst(self):
-        self._concrete_stack.append(None)
+    def _push_cst(self, cst=True):
+        self._concrete_stack.append(None if cst else NOCST)
+
+    def _nested_cst(self, cst):
+        # Expressions whose CST no named element reads have cst=False, and
+        # build one only where the enclosing expression does.
+        return cst or self._concrete_stack[-1] is not NOCST
 
     def _pop_cst(self):
         return self._concrete_stack.pop()
@@ -129,6 +531,8 @@ class ParseContext(object):
             if isinstance(node, list):
                 node = node[:]  # copy it
             self._concrete_stack[-1] = node
+        elif previous is NOCST:
+            return
         elif previous == node:  # FIXME: Don't know how this happens, but it does
             return
         elif isinstance(previous, list):
@@ -137,7 +541,7 @@ class ParseContext(object):
             self._concrete_stack[-1] = [previous, node]
 
     def _extend_cst(self, cst):
-        if cst is None:
+        if cst is None or self.cst is NOCST:
             return
         if self.cst is None:
             self.cst = cst
@@ -160,11 +564,7 @@ class ParseContext(object):
         # Kota Mizushima et al say that we can throw away
         # memos for previous positions in the buffer.
         #   http://goo.gl/VaGpj
-        cutpos = self._pos
-        cache = self._memoization_cache
-        cutkeys = [(p, n) for p, n in cache.keys() if p < cutpos]
-        for key in cutkeys:
-            del cache[key]
+        self._memoization_cache.cut(self._pos)
 
     def _push_cut(self):
         self._cut_stack.append(False)
@@ -189,6 +589,32 @@ class ParseContext(object):
             return None
         return result
 
+    def _semantic_result(self, action, node):
+        if self.defer_semantics:
+            return Deferred(action, node, self._pos)
+        try:
+            return action(node)
+        except FailedSemantics as e:
+            self._error(str(e), FailedParse)
+
+    def _run_deferred(self, node):
+        # Run the deferred semantic actions in the tree, bottom-up, and
+        # return the tree with their results.
+        if isinstance(node, Deferred):
+            action = node.action
+            if action is not None:
+                node.action = None
+                try:
+                    node.node = action(self._run_deferred(node.node))
+                except FailedSemantics as e:
+                    raise self._failure(FailedParse, str(e), node.pos)
+            return node.node
+        elif isinstance(node, list):
+            node[:] = [self._run_deferred(n) for n in node]
+        elif isinstance(node, (AST, CompactAST, TypedAST)):
+            node._map(self._run_deferred)
+        return node
+
     def _trace(self, msg, *params):
         if self.trace:
             print(unicode(msg % params).encode(self.encoding), file=sys.stderr)
@@ -207,38 +633,107 @@ class ParseContext(object):
             name = name if name else ''
             self._trace('MATCHED <%s> /%s/\n\t%s', token, name, self._buffer.lookahead())
 
+    def _failure(self, etype, item, pos=None):
+        # Most failures are discarded by backtracking, so the context
+        # reuses one instance per type instead of building a new one each
+        # time. Failures that outlive backtracking must be copied with
+        # _retain().
+        e = self._failures.get(etype)
+        if e is None:
+            e = self._failures[etype] = etype(self._buffer, item)
+            e.shared = True
+        else:
+            e.buf = self._buffer
+            e.item = item
+        e.pos = pos if pos is not None else self._buffer.pos
+        e.__traceback__ = None
+        return e
+
+    def _retain(self, e):
+        if not isinstance(e, FailedParseBase):
+            return e
+        if e.shared:
+            e = e.copy()
+        if isinstance(e.buf, FileBuffer):
+            # the file is usually closed before the failure is reported
+            e.line_info = e.buf.line_info(e.pos)
+        return e
+
+    def _memo_failure(self, e):
+        cut = isinstance(e, FailedCut)
+        if cut:
+            e = e.nested
+        if not e.shared:
+            return MemoFailure(None, e.pos, e.copy(), cut)
+        return MemoFailure(type(e), e.pos, e.item, cut)
+
+    def _raise_memo_failure(self, failure):
+        if failure.etype is None:
+            e = failure.item
+            e.__traceback__ = None
+        else:
+            e = self._failure(failure.etype, failure.item, failure.pos)
+        if failure.cut:
+            e = FailedCut(e)
+        raise e
+
     def _error(self, item, etype=FailedParse):
-        raise etype(self._buffer, item)
+        raise self._failure(etype, item)
 
     def _fail(self):
         self._error('fail')
 
-    @contextmanager
-    def _try(self):
-        p = self._pos
-        self._push_ast()
+    # Backtracking returns to a checkpoint: the position, and the depths
+    # of the AST and CST stacks. Expressions known to have no named
+    # elements are tried with ast=False, which pushes no AST, so the
+    # names they can't add go to the enclosing AST.
+
+    def _checkpoint(self):
+        return (self._pos, len(self._ast_stack), len(self._concrete_stack))
+
+    def _restore(self, checkpoint):
+        pos, asts, csts = checkpoint
+        self._goto(pos)
+        del self._ast_stack[asts:]
+        del self._concrete_stack[csts:]
+
+    def _enter_try(self, ast=True, cst=True):
+        checkpoint = self._checkpoint()
+        cst = self._nested_cst(cst)
+        if ast:
+            self._push_ast(cst=cst)
+        else:
+            self._push_cst(cst)
         self.last_node = None
+        return checkpoint
+
+    def _commit(self, checkpoint=None):
+        cst = self._pop_cst()
+        self.last_node = cst
+        if checkpoint is None or len(self._ast_stack) > checkpoint[1]:
+            self._update_ast(self._ast_stack.pop())
+        self._add_cst_node(cst)
+
+    @contextmanager
+    def _try(self, ast=True, cst=True):
+        checkpoint = self._enter_try(ast, cst)
         try:
             yield None
-            ast = self.ast
-            cst = self.cst
-            self.last_node = cst
         except:
-            self._goto(p)
+            self._restore(checkpoint)
             raise
-        finally:
-            self._pop_ast()
-        self._update_ast(ast)
-        self._add_cst_node(cst)
+        self._commit(checkpoint)
 
     @contextmanager
-    def _option(self):
+    def _option(self, choice=None, ast=True, cst=True):
         self.last_node = None
         self._push_cut()
         try:
-            with self._try():
+            with self._try(ast, cst):
                 yield None
-            raise OptionSucceeded()
+            if choice is None:
+                raise OptionSucceeded()
+            choice.done = True
         except FailedCut:
             raise
         except FailedParse as e:
@@ -250,22 +745,60 @@ class ParseContext(object):
     @contextmanager
     def _choice(self):
         try:
-            yield None
+            yield Choice()
         except OptionSucceeded:
             pass
         except FailedCut as e:
             raise e.nested
 
     @contextmanager
-    def _optional(self):
+    def _optional(self, ast=True, cst=True):
         self.last_node = None
-        with self._choice():
-            with self._option():
+        with self._choice() as choice:
+            with self._option(choice, ast, cst):
                 yield None
 
+    # Non-generator equivalents of _option(), _optional(), and _group()
+    # for parsers generated with straight-line code. The caller provides
+    # the try/except around the parsed expression.
+
+    def _enter_option(self, ast=True, cst=True):
+        self._push_cut()
+        return self._enter_try(ast, cst)
+
+    def _exit_option(self, choice=None, checkpoint=None):
+        self._commit(checkpoint)
+        self._pop_cut()
+        if choice is not None:
+            choice.done = True
+
+    def _fail_option(self, checkpoint, e):
+        self._restore(checkpoint)
+        cut = self._pop_cut()
+        if isinstance(e, FailedCut):
+            raise e
+        elif cut:
+            raise FailedCut(e)
+
+    def _fail_optional(self, checkpoint, e):
+        self._restore(checkpoint)
+        cut = self._pop_cut()
+        if isinstance(e, FailedCut):
+            raise e.nested
+        elif cut:
+            raise e
+
+    def _enter_group(self, cst=True):
+        self._push_cst(self._nested_cst(cst))
+
+    def _exit_group(self):
+        cst = self._pop_cst()
+        self._add_cst_node(cst)
+        self.last_node = cst
+
     @contextmanager
-    def _group(self):
-        self._push_cst()
+    def _group(self, cst=True):
+        self._enter_group(cst)
         try:
             yield None
             cst = self.cst
@@ -301,12 +834,12 @@ class ParseContext(object):
             self._pop_ast()  # simply discard
             self.last_node = None
 
-    def _repeater(self, f):
+    def _repeater(self, f, ast=True, cst=True):
         while True:
             self._push_cut()
             try:
                 p = self._pos
-                with self._try():
+                with self._try(ast, cst):
                     f()
                 if self._pos == p:
                     self._error('empty closure')
@@ -319,26 +852,137 @@ class ParseContext(object):
             finally:
                 self._pop_cut()
 
-    def _closure(self, block):
-        self._push_cst()
+    def _closure(self, block, ast=True, cst=True):
+        self._push_cst(self._nested_cst(cst))
         try:
-            self._repeater(block)
-            cst = to_list(self.cst)
+            self._repeater(block, ast, cst)
+            cst = self.cst
+            if cst is not NOCST:
+                cst = to_list(cst)
         finally:
             self._pop_cst()
         self._add_cst_node(cst)
         self.last_node = cst
         return cst
 
-    def _positive_closure(self, block):
-        self._push_cst()
+    def _positive_closure(self, block, ast=True, cst=True):
+        self._push_cst(self._nested_cst(cst))
         try:
-            with self._try():
+            with self._try(ast, cst):
                 block()
-            self._repeater(block)
-            cst = to_list(self.cst)
+            self._repeater(block, ast, cst)
+            cst = self.cst
+            if cst is not NOCST:
+                cst = to_list(cst)
         finally:
             self._pop_cst()
         self._add_cst_node(cst)
         self.last_node = cst
         return cst
+
+
+class NullAST(object):
+    """
+    The AST of every rule while recognizing: it ignores what is added.
+    """
+    __slots__ = ()
+
+    def add(self, key, value, force_list=False):
+        return self
+
+    def add_list(self, key, value):
+        return self
+
+    def _extend(self, key, values):
+        return self
+
+    def __setitem__(self, key, value):
+        pass
+
+    def __getitem__(self, key):
+        return None
+
+    def __contains__(self, key):
+        return False
+
+    def __len__(self):
+        return 0
+
+    def items(self):
+        return []
+
+
+NULL_AST = NullAST()
+
+
+class RecognizerMixin(object):
+    """
+    Makes a context recognize its input, with the same matching, cuts,
+    and memoization, but without building an AST or a CST and without
+    calling semantic actions. Rules return None.
+    """
+    @property
+    def ast(self):
+        return NULL_AST
+
+    @ast.setter
+    def ast(self, value):
+        pass
+
+    @property
+    def cst(self):
+        return None
+
+    @cst.setter
+    def cst(self, value):
+        pass
+
+    def _push_ast(self, ast_type=None, cst=True):
+        pass
+
+    def _pop_ast(self):
+        return NULL_AST
+
+    def _add_ast_node(self, name, node, force_list=False):
+        return node
+
+    def _update_ast(self, ast):
+        pass
+
+    def _push_cst(self, cst=True):
+        pass
+
+    def _pop_cst(self):
+        return None
+
+    def _add_cst_node(self, node):
+        pass
+
+    def _extend_cst(self, cst):
+        pass
+
+    def _find_semantic_rule(self, name):
+        return None
+
+    def _commit(self, checkpoint=None):
+        self.last_node = None
+
+    @contextmanager
+    def _try(self, ast=True, cst=True):
+        p = self._pos
+        self.last_node = None
+        try:
+            yield None
+        except:
+            self._goto(p)
+            raise
+
+    def _closure(self, block, ast=True, cst=True):
+        self._repeater(block)
+        self.last_node = None
+
+    def _positive_closure(self, block, ast=True, cst=True):
+        with self._try():
+            block()
+        self._repeater(block)
+        self.last_node = None
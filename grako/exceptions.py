@@ -7,6 +7,10 @@ to be able to report accurate error messages as late as possible with the aid
 of the .buffering.Buffer class, and with as little overhead as possible for
 exceptions that will not be parsing errors (remember that Grako uses the
 exception system to backtrack).
+
+Messages are only formatted when a failure is reported. During a parse, a
+single instance of each type of failure is reused for every failure that
+backtracking discards, and copied whenever it must outlive backtracking.
 """
 from __future__ import print_function, division, absolute_import, unicode_literals
 
@@ -40,17 +44,28 @@ class FailedSemantics(ParseError):
 
 
 class FailedParseBase(ParseError):
+    # True for the instance a ParseContext reuses for its failures
+    shared = False
+    # the line information, when kept for a buffer that may be closed
+    line_info = None
+
     def __init__(self, buf, item):
         self.buf = buf
         self.pos = buf.pos
         self.item = item
 
+    def copy(self):
+        result = self.__class__.__new__(self.__class__)
+        result.__dict__.update(self.__dict__)
+        result.__dict__.pop('shared', None)
+        return result
+
     @property
     def message(self):
         return self.item
 
     def __str__(self):
-        info = self.buf.line_info(self.pos)
+        info = self.line_info or self.buf.line_info(self.pos)
         template = "{}({}:{}) {} :\n{}\n{}^"
         return template.format(info.filename,
                                info.line + 1, info.col + 1,
@@ -65,9 +80,9 @@ class FailedParse(FailedParseBase):
 
 
 class FailedToken(FailedParse):
-    def __init__(self, buf, token):
-        super(FailedToken, self).__init__(buf, token)
-        self.token = token
+    @property
+    def token(self):
+        return self.item
 
     @property
     def message(self):
@@ -75,9 +90,9 @@ class FailedToken(FailedParse):
 
 
 class FailedPattern(FailedParse):
-    def __init__(self, buf, pattern):
-        super(FailedPattern, self).__init__(buf, pattern)
-        self.pattern = pattern
+    @property
+    def pattern(self):
+        return self.item
 
     @property
     def message(self):
@@ -95,9 +110,9 @@ class FailedMatch(FailedParse):
 
 
 class FailedRef(FailedParseBase):
-    def __init__(self, buf, name):
-        super(FailedRef, self).__init__(buf, name)
-        self.name = name
+    @property
+    def name(self):
+        return self.item
 
     @property
     def message(self):
@@ -106,19 +121,33 @@ class FailedRef(FailedParseBase):
 
 class FailedCut(FailedParse):
     def __init__(self, nested):
-        super(FailedCut, self).__init__(nested.buf, nested.item)
+        self.buf = nested.buf
         self.pos = nested.pos
+        self.item = nested.item
         self.nested = nested
 
+    @property
+    def shared(self):
+        return self.nested.shared
+
+    def copy(self):
+        result = super(FailedCut, self).copy()
+        result.nested = self.nested.copy()
+        return result
+
     @property
     def message(self):
         return self.nested.message
 
 
 class FailedChoice(FailedParse):
+    # The item is the FIRST set of the choice.
     @property
     def message(self):
-        return 'no viable option'
+        firstset = ' '.join(repr(f[0]).lstrip('u') for f in self.item or () if f)
+        if firstset:
+            return 'one of {%s}' % firstset
+        return 'no available options'
 
 
 class FailedLookahead(FailedParse):
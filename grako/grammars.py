@@ -7,25 +7,26 @@ able to parse the language defined by the grammar, but the main purpose of
 the model is the generation of independent, top-down, verbose, and debugable
 parsers through the inline templates from the .rendering module.
 
-Models calculate the LL(k) FIRST function to aid in providing more significant
-error messages when a choice fails to parse. FOLLOW(k) and LA(k) should be
-computed, but they are not.
+Models calculate the LL(k) FIRST and FOLLOW functions to aid in providing
+more significant error messages when a choice fails to parse. The sets for
+each k are calculated with a worklist over the rules, and cached on the
+Grammar.
 """
 from __future__ import print_function, division, absolute_import, unicode_literals
 import sys
-import re
-from copy import deepcopy
+from collections import deque, OrderedDict
 from keyword import iskeyword
 import time
 from .util import indent, trim
 from .rendering import Renderer, render
-from .buffering import Buffer
-from .contexts import ParseContext, ParseInfo
+from .buffering import Buffer, PATTERNS
+from .contexts import ParseContext, ParseInfo, RecognizerMixin, NOCST
+from .ast import TypedAST
 from .exceptions import (FailedParse,
                          FailedToken,
                          FailedPattern,
+                         FailedChoice,
                          FailedRef,
-                         FailedSemantics,
                          GrammarError)
 
 
@@ -34,7 +35,20 @@ def check(result):
 
 
 def dot(x, y, k):
-    return set([(a + b)[:k] for a in x for b in y])
+    if not y:
+        return set()
+    # a prefix of length n only needs the distinct heads of length k - n
+    result = set()
+    heads = {}
+    for a in x:
+        n = k - len(a)
+        if n <= 0:
+            result.add(a)
+            continue
+        if n not in heads:
+            heads[n] = {b[:n] for b in y} if n < k else y
+        result.update(a + b for b in heads[n])
+    return result
 
 
 def urepr(obj):
@@ -51,6 +65,8 @@ def udrepr(s):
 
 class ModelContext(ParseContext):
     def __init__(self, rules, buffer=None, semantics=None, trace=False, **kwargs):
+        self._rule_names = [rule.name for rule in rules]
+        self._rule_ids = {name: i for i, name in enumerate(self._rule_names)}
         super(ModelContext, self).__init__(buffer=buffer,
                                            semantics=semantics,
                                            trace=trace,
@@ -70,14 +86,63 @@ class ModelContext(ParseContext):
         return self.rules[name]
 
 
+class RecognizerContext(RecognizerMixin, ModelContext):
+    pass
+
+
 class _Model(Renderer):
+    # Set by Grammar.codegen() to render with inline_template, which
+    # expands context managers into straight-line code.
+    _inline = False
+    inline_template = None
+    # Set by Grammar.codegen() to render with recognizer_template, which
+    # leaves out the building of the AST.
+    _recognizer = False
+    recognizer_template = None
+    # Set by Grammar() to the value of named. Expressions without named
+    # elements are tried without an AST of their own.
+    _named = True
+    # Set by Grammar() to False for the expressions outside named elements,
+    # whose CST is only built where the enclosing one is.
+    _read = True
+
     def __init__(self):
         super(_Model, self).__init__()
         self._first_set = None
 
+    def render(self, template=None, **fields):
+        if template is None and self._recognizer and self.recognizer_template:
+            template = self.recognizer_template
+        if template is None and self._inline and self.inline_template:
+            template = self.inline_template
+        return super(_Model, self).render(template, **fields)
+
     def parse(self, ctx):
         return None
 
+    def children(self):
+        return []
+
+    def nodes(self):
+        yield self
+        for child in self.children():
+            for node in child.nodes():
+                yield node
+
+    @property
+    def named(self):
+        # True if the expression has named elements
+        return any(isinstance(node, (Named, Override)) for node in self.nodes())
+
+    @property
+    def ast_arg(self):
+        # the arguments that try the expression without an AST, and
+        # without a CST of its own
+        args = [] if self._named else ['ast=False']
+        if not self._read:
+            args.append('cst=False')
+        return ', '.join(args)
+
     @property
     def firstset(self, k=1):
         if self._first_set is None:
@@ -90,11 +155,31 @@ class _Model(Renderer):
     def _first(self, k, F):
         return set()
 
+    def _follow(self, k, F, FL, follow, changed):
+        # Add to FL, the FOLLOW sets of the rules, what may follow the
+        # rules referenced in this expression, given that follow may
+        # follow the expression, and add the names of the rules whose
+        # FOLLOW set grew to changed.
+        pass
+
+    def _first_chars(self, C):
+        # The characters the input may start with for the expression to
+        # match, after skipping whitespace and comments, as a pair
+        # (chars, nullable), or None when they can't be known. C maps
+        # rule names to their own pairs.
+        return None
+
 
 class Void(_Model):
     def __str__(self):
         return '()'
 
+    def _first(self, k, F):
+        return {()}
+
+    def _first_chars(self, C):
+        return (frozenset(), True)
+
     template = 'pass'
 
 
@@ -113,6 +198,9 @@ class Comment(_Model):
     def __str__(self):
         return self.render()
 
+    def _first_chars(self, C):
+        return (frozenset(), True)
+
     template = '''
         (* {text} *)
 
@@ -123,7 +211,10 @@ class EOF(_Model):
     def parse(self, ctx):
         ctx._next_token()
         if not ctx.buf.atend():
-            raise FailedParse(ctx.buf, 'Expecting end of text.')
+            ctx._error('Expecting end of text.')
+
+    def _first(self, k, F):
+        return {()}
 
     def __str__(self):
         return '$'
@@ -140,12 +231,21 @@ class _Decorator(_Model):
     def parse(self, ctx):
         return self.exp.parse(ctx)
 
+    def children(self):
+        return [self.exp]
+
     def _validate(self, rules):
         return self.exp._validate(rules)
 
     def _first(self, k, F):
         return self.exp._first(k, F)
 
+    def _follow(self, k, F, FL, follow, changed):
+        self.exp._follow(k, F, FL, follow, changed)
+
+    def _first_chars(self, C):
+        return self.exp._first_chars(C)
+
     def __str__(self):
         return str(self.exp)
 
@@ -154,7 +254,7 @@ class _Decorator(_Model):
 
 class Group(_Decorator):
     def parse(self, ctx):
-        with ctx._group():
+        with ctx._group(self._read):
             return self.exp.parse(ctx)
 
     def __str__(self):
@@ -166,11 +266,24 @@ class Group(_Decorator):
             template = '\n' + trim(self.str_template)
         return template % exp
 
+    def render_fields(self, fields):
+        fields.update(cst='' if self._read else 'cst=False')
+
     template = '''\
-                with self._group():
+                with self._group({cst}):
                 {exp:1::}\
                 '''
 
+    inline_template = '''\
+                self._enter_group({cst})
+                try:
+                {exp:1::}
+                except FailedParse:
+                    self._pop_cst()
+                    raise
+                self._exit_group()\
+                '''
+
     str_template = '''
             (
             %s
@@ -189,7 +302,7 @@ class Token(_Model):
         ctx._next_token()
         token = ctx.buf.match(self.token)
         if token is None:
-            raise FailedToken(ctx.buf, self.token)
+            raise ctx._failure(FailedToken, self.token)
 
         ctx._trace_match(self.token, None)
         ctx._add_cst_node(token)
@@ -198,6 +311,19 @@ class Token(_Model):
     def _first(self, k, F):
         return set([(self.token,)])
 
+    def _first_chars(self, C):
+        # the model matches the token as written, and generated parsers
+        # match it with its escapes decoded
+        try:
+            tokens = (self.token, decode(self.token))
+        except UnicodeError:
+            return None
+        chars = set()
+        for token in tokens:
+            if token:
+                chars.update((token[0], token[0].lower()))
+        return (frozenset(chars), False)
+
     def __str__(self):
         if "'" in self.token:
             if '"' in self.token:
@@ -217,12 +343,12 @@ class Pattern(_Model):
     def __init__(self, pattern):
         super(Pattern, self).__init__()
         self.pattern = pattern
-        self._re = re.compile(pattern)
+        self._re = PATTERNS.compile(pattern)
 
     def parse(self, ctx):
         token = ctx.buf.matchre(self._re)
         if token is None:
-            raise FailedPattern(ctx.buf, self.pattern)
+            raise ctx._failure(FailedPattern, self.pattern)
         ctx._trace_match(token, self.pattern)
         ctx._add_cst_node(token)
         return token
@@ -233,9 +359,11 @@ class Pattern(_Model):
     def __str__(self):
         return '?/%s/?' % self.pattern
 
+    def raw_repr(self):
+        return 'r' + repr(self.pattern).replace("\\\\", '\\')
+
     def render_fields(self, fields):
-        raw_repr = 'r' + repr(self.pattern).replace("\\\\", '\\')
-        fields.update(pattern=raw_repr)
+        fields.update(pattern=self.raw_repr())
 
     template = 'self._pattern({pattern})'
 
@@ -244,6 +372,12 @@ class Lookahead(_Decorator):
     def __str__(self):
         return '&' + str(self.exp)
 
+    def _first(self, k, F):
+        return {()}
+
+    def _first_chars(self, C):
+        return None
+
     def parse(self, ctx):
         with ctx._if():
             super(Lookahead, self).parse(ctx)
@@ -258,6 +392,12 @@ class LookaheadNot(_Decorator):
     def __str__(self):
         return '!' + str(self.exp)
 
+    def _first(self, k, F):
+        return {()}
+
+    def _first_chars(self, C):
+        return None
+
     def parse(self, ctx):
         with ctx._ifnot():
             super(LookaheadNot, self).parse(ctx)
@@ -284,6 +424,9 @@ class Sequence(_Model):
                 result.append(tree)
         return result
 
+    def children(self):
+        return self.sequence
+
     def _validate(self, rules):
         return all(s._validate(rules) for s in self.sequence)
 
@@ -293,6 +436,22 @@ class Sequence(_Model):
             result = dot(result, s._first(k, F), k)
         return result
 
+    def _follow(self, k, F, FL, follow, changed):
+        for s in reversed(self.sequence):
+            s._follow(k, F, FL, follow, changed)
+            follow = dot(s._first(k, F), follow, k)
+
+    def _first_chars(self, C):
+        chars = frozenset()
+        for s in self.sequence:
+            first = s._first_chars(C)
+            if first is None:
+                return None
+            chars |= first[0]
+            if not first[1]:
+                return (chars, False)
+        return (chars, True)
+
     def __str__(self):
         return ' '.join(str(s).strip() for s in self.sequence)
 
@@ -305,6 +464,12 @@ class Sequence(_Model):
 
 
 class Choice(_Model):
+    # Set by Grammar: the first characters of each option, or None for
+    # the options that must always be tried, and the dispatch table
+    # built from them.
+    _option_chars = None
+    _dispatch = None
+
     def __init__(self, options):
         super(Choice, self).__init__()
         assert isinstance(options, list), urepr(options)
@@ -313,14 +478,20 @@ class Choice(_Model):
             assert isinstance(o, _Model), str(o)
 
     def parse(self, ctx):
-        with ctx._choice():
-            for o in self.options:
-                with ctx._option():
+        options = self.options
+        if self._dispatch is not None:
+            table, always = self._dispatch
+            options = table.get(ctx._peek_char(), always)
+        with ctx._choice() as choice:
+            for o in options:
+                with ctx._option(choice, o._named, o._read):
                     o.parse(ctx)
-            firstset = ' '.join(str(urepr(f[0])) for f in self.firstset if f)
-            if firstset:
-                raise FailedParse(ctx.buf, 'one of {%s}' % firstset)
-            raise FailedParse(ctx.buf, 'no available options')
+                if choice.done:
+                    return
+            raise ctx._failure(FailedChoice, self.firstset)
+
+    def children(self):
+        return self.options
 
     def _validate(self, rules):
         return all(o._validate(rules) for o in self.options)
@@ -331,19 +502,69 @@ class Choice(_Model):
             result |= o._first(k, F)
         return result
 
+    def _follow(self, k, F, FL, follow, changed):
+        for o in self.options:
+            o._follow(k, F, FL, follow, changed)
+
+    def _first_chars(self, C):
+        chars = frozenset()
+        nullable = False
+        for o in self.options:
+            first = o._first_chars(C)
+            if first is None:
+                return None
+            chars |= first[0]
+            nullable = nullable or first[1]
+        return (chars, nullable)
+
+    def _set_dispatch(self, C):
+        # Options that can't be empty and can only start with known
+        # characters are skipped when the next character isn't one of
+        # them. A cut can't happen before the first character matches,
+        # so the outcome of the choice is the same.
+        option_chars = []
+        for o in self.options:
+            first = o._first_chars(C)
+            option_chars.append(first[0] if first and not first[1] else None)
+        if all(chars is None for chars in option_chars):
+            self._option_chars = self._dispatch = None
+            return
+        self._option_chars = option_chars
+        table = {}
+        for chars in option_chars:
+            for c in chars or ():
+                table[c] = [o for o, oc in zip(self.options, option_chars) if oc is None or c in oc]
+        always = [o for o, oc in zip(self.options, option_chars) if oc is None]
+        self._dispatch = (table, always)
+
     def __str__(self):
         return '  ' + '\n| '.join(str(o).strip() for o in self.options)
 
     def render_fields(self, fields):
-        template = trim(self.option_template)
-        options = [template.format(option=indent(render(o))) for o in self.options]
+        n = self.counter()
+        template = trim(self.inline_option_template if self._inline else self.option_template)
+        guard = trim(self.guard_template)
+        dispatch = trim(self.dispatch_template)
+        option_chars = self._option_chars or [None] * len(self.options)
+        options = []
+        for i, (o, chars) in enumerate(zip(self.options, option_chars)):
+            ast = ', ' + o.ast_arg if o.ast_arg else ''
+            option = template.format(n=n, ast=ast, ast_arg=o.ast_arg, option=indent(render(o)))
+            if chars is not None:
+                chars = ', '.join(urepr(c) for c in sorted(chars))
+                option = dispatch.format(n=n, chars=chars, option=indent(option))
+            if i:
+                option = guard.format(n=n, option=indent(option))
+            options.append(option)
+        if self._option_chars is not None:
+            options.insert(0, 'c{n} = self._peek_char()'.format(n=n))
         options = '\n'.join(o for o in options)
         firstset = ' '.join(decode(f[0]) for f in self.firstset if f)
         if firstset:
             error = 'expecting one of: ' + firstset
         else:
             error = 'no available options'
-        fields.update(n=self.counter(),
+        fields.update(n=n,
                       options=indent(options),
                       error=urepr(error)
                       )
@@ -355,27 +576,66 @@ class Choice(_Model):
             return super(Choice, self).render(**fields)
 
     option_template = '''\
-                    with self._option():
+                    with self._option(choice{n}{ast}):
+                    {option}\
+                    '''
+
+    guard_template = '''\
+                    if not choice{n}.done:
+                    {option}\
+                    '''
+
+    dispatch_template = '''\
+                    if c{n} in {{{chars}}}:
                     {option}\
                     '''
 
     template = '''\
-                with self._choice():
+                with self._choice() as choice{n}:
+                {options}
+                    if not choice{n}.done:
+                        self._error({error})\
+                '''
+
+    inline_option_template = '''\
+                    p{n} = self._enter_option({ast_arg})
+                    try:
+                    {option}
+                    except FailedParse as e:
+                        self._fail_option(p{n}, e)
+                    else:
+                        self._exit_option(choice{n}, p{n})\
+                    '''
+
+    inline_template = '''\
+                choice{n} = Choice()
+                try:
                 {options}
-                    self._error({error})\
+                    if not choice{n}.done:
+                        self._error({error})
+                except FailedCut as e:
+                    raise e.nested\
                 '''
 
 
 class Closure(_Decorator):
     def parse(self, ctx):
-        return ctx._closure(lambda: self.exp.parse(ctx))
+        return ctx._closure(lambda: self.exp.parse(ctx), self.exp._named, self.exp._read)
 
     def _first(self, k, F):
         efirst = self.exp._first(k, F)
-        result = {()}
+        result = repeated = {()}
         for _i in range(k):
-            result = dot(result, efirst, k)
-        return {()} | result
+            repeated = dot(repeated, efirst, k)
+            result = result | repeated
+        return result
+
+    def _follow(self, k, F, FL, follow, changed):
+        self.exp._follow(k, F, FL, dot(self._first(k, F), follow, k), changed)
+
+    def _first_chars(self, C):
+        first = self.exp._first_chars(C)
+        return (first[0], True) if first is not None else None
 
     def __str__(self):
         exp = self.exp
@@ -387,7 +647,8 @@ class Closure(_Decorator):
         return template.format(exp=str(exp))
 
     def render_fields(self, fields):
-        fields.update(n=self.counter())
+        ast = ', ' + self.exp.ast_arg if self.exp.ast_arg else ''
+        fields.update(n=self.counter(), ast=ast)
 
     def render(self, **fields):
         if {()} in self.exp.firstset:
@@ -398,7 +659,7 @@ class Closure(_Decorator):
 
                 def block{n}():
                 {exp:1::}
-                self._closure(block{n})\
+                self._closure(block{n}{ast})\
                 '''
 
     str_template = '''
@@ -410,37 +671,50 @@ class Closure(_Decorator):
 
 class PositiveClosure(Closure):
     def parse(self, ctx):
-        return ctx._positive_closure(lambda: self.exp.parse(ctx))
+        return ctx._positive_closure(lambda: self.exp.parse(ctx), self.exp._named, self.exp._read)
 
     def _first(self, k, F):
         efirst = self.exp._first(k, F)
-        result = {()}
+        result = set()
+        repeated = {()}
         for _i in range(k):
-            result = dot(result, efirst, k)
+            repeated = dot(repeated, efirst, k)
+            result |= repeated
         return result
 
+    def _follow(self, k, F, FL, follow, changed):
+        repeated = {()} | self._first(k, F)
+        self.exp._follow(k, F, FL, dot(repeated, follow, k), changed)
+
+    def _first_chars(self, C):
+        return self.exp._first_chars(C)
+
     def __str__(self):
         return super(PositiveClosure, self).__str__() + '+'
 
-    def render_fields(self, fields):
-        fields.update(n=self.counter())
-
     template = '''
                 def block{n}():
                 {exp:1::}
-                self._positive_closure(block{n})
+                self._positive_closure(block{n}{ast})
                 '''
 
 
 class Optional(_Decorator):
 
     def parse(self, ctx):
-        with ctx._optional():
+        with ctx._optional(self.exp._named, self.exp._read):
             return self.exp.parse(ctx)
 
     def _first(self, k, F):
         return {()} | self.exp._first(k, F)
 
+    def _first_chars(self, C):
+        first = self.exp._first_chars(C)
+        return (first[0], True) if first is not None else None
+
+    def render_fields(self, fields):
+        fields.update(n=self.counter(), ast=self.exp.ast_arg)
+
     def __str__(self):
         exp = str(self.exp)
         template = '[%s]'
@@ -451,10 +725,20 @@ class Optional(_Decorator):
         return template % exp
 
     template = '''\
-                with self._optional():
+                with self._optional({ast}):
                 {exp:1::}\
                 '''
 
+    inline_template = '''\
+                p{n} = self._enter_option({ast})
+                try:
+                {exp:1::}
+                except FailedParse as e:
+                    self._fail_optional(p{n}, e)
+                else:
+                    self._exit_option(None, p{n})\
+                '''
+
     str_template = '''
             {
             %s
@@ -468,7 +752,7 @@ class Cut(_Model):
         return None
 
     def _first(self, k, F):
-        return {('>>',)}
+        return {()}
 
     def __str__(self):
         return '>>'
@@ -502,6 +786,7 @@ class Named(_Decorator):
                 {exp}
                 self.ast['{name}'] = self.last_node\
                 '''
+    recognizer_template = '{exp}'
 
 
 class NamedList(Named):
@@ -532,6 +817,7 @@ class Override(_Decorator):
                 {exp}
                 self.ast['@'] = self.last_node\
                 '''
+    recognizer_template = '{exp}'
 
 
 class Special(_Model):
@@ -571,8 +857,15 @@ class RuleRef(_Model):
         return True
 
     def _first(self, k, F):
-        self._first_set = F.get(self.name, set())
-        return self._first_set
+        return F.get(self.name, set())
+
+    def _follow(self, k, F, FL, follow, changed):
+        if not follow <= FL[self.name]:
+            FL[self.name] |= follow
+            changed.add(self.name)
+
+    def _first_chars(self, C):
+        return C.get(self.name)
 
     def __str__(self):
         return self.name
@@ -587,9 +880,18 @@ class RuleRef(_Model):
 
 
 class Rule(Named):
-    def __init__(self, name, exp, ast_name=None):
+    memoize = True
+    # Set by Grammar.codegen() to the name of the node class generated
+    # for the rule, if any.
+    _node_type = None
+    # Set by Grammar() to the value of named.
+    _named = False
+    recognizer_template = None
+
+    def __init__(self, name, exp, ast_name=None, memoize=True):
         super(Rule, self).__init__(name, exp)
         self.ast_name = ast_name
+        self.memoize = memoize
 
     def parse(self, ctx):
         ctx._rule_stack.append(self.name)
@@ -607,19 +909,46 @@ class Rule(Named):
         finally:
             ctx._rule_stack.pop()
 
-    def _invoke_rule(self, name, ctx):
-        key = (ctx.pos, name)
-        cache = ctx._memoization_cache
+    @property
+    def node_type_name(self):
+        name = self.ast_name or self.name
+        return ''.join(part[:1].upper() + part[1:] for part in name.split('_')) + 'Node'
+
+    def node_fields(self):
+        # The names of the elements of the rule, in order, or None when
+        # the rule has none or its AST can't be a node class.
+        fields = []
+        for node in self.exp.nodes():
+            if isinstance(node, Override):
+                return None
+            elif isinstance(node, Named):
+                name = node.name + '_' if iskeyword(node.name) else node.name
+                if hasattr(TypedAST, name):
+                    return None
+                if name not in fields:
+                    fields.append(name)
+        return fields or None
 
-        if key in cache:
-            return cache[key]
+    @property
+    def named(self):
+        # True if the AST of the rule has named elements
+        return self.exp.named
 
+    def _invoke_rule(self, name, ctx):
         pos = ctx._pos
-        ctx._push_ast()
+        key = ctx._memo_keys[ctx._rule_ids[name]]
+        cache = ctx._memoization_cache
+        memoize = ctx._memoizes(name, self.memoize)
+        if memoize:
+            result = cache.get(pos, key)
+            if result is not None:
+                return result
+
+        ctx._push_ast(cst=not (ctx.ast_only and self._named))
         try:
             self.exp.parse(ctx)
             node = ctx.ast
-            if not node:
+            if not node and ctx.cst is not NOCST:
                 node = ctx.cst
             elif '@' in node:
                 node = node['@']
@@ -631,41 +960,40 @@ class Rule(Named):
             ctx._pop_ast()
         node = self._call_semantics(ctx, name, node)
         result = (node, ctx.pos)
-        cache[key] = result
+        if memoize:
+            cache.set(pos, key, result)
         return result
 
     def _call_semantics(self, ctx, name, node):
         semantic_rule = ctx._find_semantic_rule(name)
         if semantic_rule:
-            try:
-                node = semantic_rule(node)
-            except FailedSemantics as e:
-                ctx._error(str(e), FailedParse)
+            node = ctx._semantic_result(semantic_rule, node)
         return node
 
-    def _first(self, k, F):
-        if self._first_set:
-            return self._first_set
-        return self.exp._first(k, F)
-
     def __str__(self):
-        return trim(self.str_template) % (self.name, indent(str(self.exp)))
+        result = trim(self.str_template) % (self.name, indent(str(self.exp)))
+        if not self.memoize:
+            result = '@nomemo\n' + result
+        return result
 
     def render_fields(self, fields):
         self.reset_counter()
         name = self.name
         if iskeyword(name):
             name += '_'
-        if self.ast_name:
-            ast_name_clause = '\nself.ast = AST(%s=self.ast)\n' % self.ast_name_
+        if self.ast_name and not self._node_type and not self._recognizer:
+            ast_name_clause = '\nself.ast = self.ast_type(%s=self.ast)\n' % self.ast_name_
         else:
             ast_name_clause = ''
         fields.update(name=name,
-                      ast_name_clause=ast_name_clause
+                      ast_name_clause=ast_name_clause,
+                      named='\n@named_rule' if self.named and not self._recognizer else '',
+                      node='\n@rule_node(%s)' % self._node_type if self._node_type else '',
+                      nomemo='' if self.memoize else '\n@nomemo'
                       )
 
     template = '''
-                @rule_def
+                @rule_def{named}{node}{nomemo}
                 def {name}(self):
                 {exp:1::}{ast_name_clause}
 
@@ -679,6 +1007,11 @@ class Rule(Named):
 
 
 class Grammar(Renderer):
+    # Set by codegen() to the fields of each node class to generate,
+    # and to whether to generate a recognizer.
+    _node_types = ()
+    _recognizer = False
+
     def __init__(self, name, rules):
         super(Grammar, self).__init__()
         assert isinstance(rules, list), str(rules)
@@ -686,7 +1019,19 @@ class Grammar(Renderer):
         self.rules = rules
         if not self._validate({r.name for r in self.rules}):
             raise GrammarError('Unknown rules, no parser generated.')
-        self._first_sets = self._calc_first_sets()
+        self._first_cache = {}
+        self._follow_cache = {}
+        self._first_sets = self.calc_first_sets()
+        for rule in self.rules:
+            for node in rule.nodes():
+                node._named = node.named
+                node._read = False
+                node._first_set = node._first(1, self._first_sets)
+            for node in rule.exp.nodes():
+                if isinstance(node, (Named, Override)):
+                    for read in node.exp.nodes():
+                        read._read = True
+        self._calc_dispatch()
 
     def _validate(self, ruleset):
         return all(rule._validate(ruleset) for rule in self.rules)
@@ -695,36 +1040,156 @@ class Grammar(Renderer):
     def first_sets(self):
         return self._first_sets
 
-    def _calc_first_sets(self, k=1):
-        F = dict()
-        while True:
-            F1 = deepcopy(F)
-            for rule in self.rules:
-                F[rule.name] = F.get(rule.name, set()) | rule._first(k, F)
-            if F1 == F:
-                break
+    @property
+    def follow_sets(self):
+        return self.calc_follow_sets()
+
+    @property
+    def nullable(self):
+        return {name for name, first in self._first_sets.items() if () in first}
+
+    def _references(self):
+        # the rules that reference each rule
+        result = {rule.name: [] for rule in self.rules}
         for rule in self.rules:
-            rule._first_set = F[rule.name]
+            for node in rule.nodes():
+                if isinstance(node, RuleRef) and rule not in result[node.name]:
+                    result[node.name].append(rule)
+        return result
+
+    def calc_first_sets(self, k=1):
+        if k in self._first_cache:
+            return self._first_cache[k]
+        # A rule is evaluated again only when the FIRST set of a rule it
+        # references grows. The sets only grow, so they're updated in
+        # place.
+        F = {rule.name: set() for rule in self.rules}
+        references = self._references()
+        pending = deque(reversed(self.rules))
+        queued = set(F)
+        while pending:
+            rule = pending.popleft()
+            queued.discard(rule.name)
+            first = rule._first(k, F)
+            if first != F[rule.name]:
+                F[rule.name] = first
+                for referrer in references[rule.name]:
+                    if referrer.name not in queued:
+                        queued.add(referrer.name)
+                        pending.append(referrer)
+        self._first_cache[k] = F
         return F
 
+    def calc_follow_sets(self, k=1):
+        if k in self._follow_cache:
+            return self._follow_cache[k]
+        # The empty sequence in a FOLLOW set stands for the end of the
+        # input. A rule's body is propagated again only when its own
+        # FOLLOW set grows.
+        F = self.calc_first_sets(k)
+        FL = {rule.name: set() for rule in self.rules}
+        if self.rules:
+            FL[self.rules[0].name].add(())
+        rules = {rule.name: rule for rule in self.rules}
+        pending = deque(self.rules)
+        queued = set(FL)
+        while pending:
+            rule = pending.popleft()
+            queued.discard(rule.name)
+            changed = set()
+            rule.exp._follow(k, F, FL, set(FL[rule.name]), changed)
+            for name in changed:
+                if name not in queued:
+                    queued.add(name)
+                    pending.append(rules[name])
+        self._follow_cache[k] = FL
+        return FL
+
+    def _calc_dispatch(self):
+        C = {rule.name: (frozenset(), False) for rule in self.rules}
+        changed = True
+        while changed:
+            changed = False
+            for rule in self.rules:
+                first = rule._first_chars(C)
+                if first != C[rule.name]:
+                    C[rule.name] = first
+                    changed = True
+        for rule in self.rules:
+            for node in rule.nodes():
+                if isinstance(node, Choice):
+                    node._set_dispatch(C)
+
     def parse(self, text,
                     start=None,
                     filename=None,
                     semantics=None,
                     trace=False,
                     **kwargs):
+        return self._parse(ModelContext, text, start,
+                           filename=filename,
+                           semantics=semantics,
+                           trace=trace,
+                           **kwargs)
+
+    def recognize(self, text, start=None, filename=None, trace=False, **kwargs):
+        self._parse(RecognizerContext, text, start,
+                    filename=filename,
+                    trace=trace,
+                    **kwargs)
+        return True
+
+    def _parse(self, context, text,
+                    start=None,
+                    filename=None,
+                    semantics=None,
+                    trace=False,
+                    **kwargs):
         if not isinstance(text, Buffer):
             text = Buffer(text, filename=filename, **kwargs)
-        ctx = ModelContext(self.rules,
-                           buffer=text,
-                           semantics=semantics,
-                           trace=trace, **kwargs)
+        ctx = context(self.rules,
+                      buffer=text,
+                      semantics=semantics,
+                      trace=trace, **kwargs)
         start_rule = ctx._find_rule(start) if start else self.rules[0]
-        with ctx._choice():
-            return start_rule.parse(ctx)
+        try:
+            with ctx._choice():
+                result = start_rule.parse(ctx)
+                if ctx.defer_semantics:
+                    result = ctx._run_deferred(result)
+                return result
+        except FailedParse as e:
+            if not e.shared:
+                ctx._retain(e)
+                raise
+            e = ctx._retain(e)
+            e.__suppress_context__ = True
+            raise e
+
+    def codegen(self, inline=False, nodes=False, recognizer=False):
+        # the modes are set on the model only while it renders
+        self._set_modes(inline, nodes, recognizer)
+        try:
+            return self.render()
+        finally:
+            self._set_modes()
 
-    def codegen(self):
-        return self.render()
+    def _set_modes(self, inline=False, nodes=False, recognizer=False):
+        node_types = OrderedDict()
+        self._recognizer = recognizer
+        for rule in self.rules:
+            for node in rule.nodes():
+                node._inline = inline
+                node._recognizer = recognizer
+            fields = rule.node_fields() if nodes and not recognizer else None
+            if fields:
+                # rules with the same ast_name share their node class
+                rule._node_type = rule.node_type_name
+                known = node_types.setdefault(rule._node_type, [])
+                known.extend(f for f in fields if f not in known)
+            else:
+                rule._node_type = None
+        self._node_types = node_types
 
     def __str__(self):
         return '\n\n'.join(str(rule) for rule in self.rules) + '\n'
@@ -733,11 +1198,37 @@ class Grammar(Renderer):
         abstract_template = trim(self.abstract_rule_template)
         abstract_rules = [abstract_template.format(name=rule.name) for rule in self.rules]
         abstract_rules = indent('\n'.join(abstract_rules))
+        patterns = []
+        for rule in self.rules:
+            for node in rule.nodes():
+                if isinstance(node, Pattern) and node.raw_repr() not in patterns:
+                    patterns.append(node.raw_repr())
+        patterns = ''.join('\n' + indent(p) + ',' for p in patterns)
+        nodes = node_import = json_default = ''
+        if self._node_types:
+            node_template = trim(self.node_template)
+            nodes = ['\n']
+            for name, names in self._node_types.items():
+                names = ', '.join("'%s'" % f for f in names) + (',' if len(names) == 1 else '')
+                nodes.append('\n' + node_template.format(name=name, fields=names))
+            nodes = '\n'.join(nodes)
+            node_import = '\nfrom grako.ast import TypedAST'
+            json_default = ', default=TypedAST.asjson'
         fields.update(rules=indent(render(self.rules)),
+                      nodes=nodes,
+                      node_import=node_import,
+                      json_default=json_default,
+                      parser_base='Recognizer' if self._recognizer else 'Parser',
                       abstract_rules=abstract_rules,
+                      patterns=patterns,
                       version=time.strftime('%y.%j.%H.%M.%S', time.gmtime())
                       )
 
+    node_template = '''
+            class {name}(TypedAST):
+                __slots__ = ({fields})
+            '''
+
     abstract_rule_template = '''
             def {name}(self, ast):
                 return ast
@@ -757,10 +1248,14 @@ class Grammar(Renderer):
                 from __future__ import print_function, division, absolute_import, unicode_literals
                 from grako.parsing import * # @UnusedWildImport
                 from grako.exceptions import * # @UnusedWildImport
+                from grako.buffering import PATTERNS{node_import}
 
                 __version__ = '{version}'
 
-                class {name}Parser(Parser):
+                PATTERNS.register({patterns}
+                ){nodes}
+
+                class {name}Parser({parser_base}):
                 {rules}
 
 
@@ -781,7 +1276,7 @@ class Grammar(Renderer):
                     print(ast)
                     print()
                     print('JSON:')
-                    print(json.dumps(ast, indent=2))
+                    print(json.dumps(ast, indent=2{json_default}))
                     print()
 
                 if __name__ == '__main__':
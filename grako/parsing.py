@@ -16,15 +16,36 @@ Parser.parse() will take the text to parse directly, or an instance of the
 from __future__ import print_function, division, absolute_import, unicode_literals
 import functools
 from . import buffering
-from .contexts import ParseContext, ParseInfo
-from .exceptions import (FailedParse,
+from .contexts import ParseContext, RecognizerMixin, ParseInfo, MemoFailure, NOCST
+from .contexts import Choice  # for the inline code of generated parsers @UnusedImport
+from .exceptions import (FailedParseBase,
+                         FailedParse,
                          FailedToken,
                          FailedPattern,
                          FailedRef,
-                         FailedSemantics,
                          MissingSemanticFor)
 
 
+# marks the semantic actions not looked up yet
+_UNRESOLVED = object()
+
+
+class RuleInfo(object):
+    """
+    What the parser needs to know about a rule on each invocation,
+    computed once when the rule is defined.
+    """
+    __slots__ = ('name', 'func', 'skip', 'memoize', 'node_type', 'named')
+
+    def __init__(self, func):
+        self.name = func.__name__.strip('_')
+        self.func = func
+        self.skip = self.name[0].islower()
+        self.memoize = getattr(func, 'memoize', True)
+        self.node_type = getattr(func, 'node_type', None)
+        self.named = getattr(func, 'named', False)
+
+
 class CheckSemanticsMixin(object):
     def _find_semantic_rule(self, name):
         result = super(CheckSemanticsMixin, self)._find_semantic_rule(name)
@@ -58,10 +79,41 @@ class Parser(ParseContext):
             self._push_ast()
             rule = self._find_rule(rule_name)
             result = rule()
+            if self.defer_semantics:
+                result = self._run_deferred(result)
             self.ast[rule_name] = result
             return result
+        except FailedParse as e:
+            if not e.shared:
+                self._retain(e)
+                raise
+            e = self._retain(e)
+            e.__suppress_context__ = True
+            raise e
+        finally:
+            self._memoization_cache.clear()
+            self._failures.clear()  # they hold the buffer
+
+    def recognize(self, text, *args, **kwargs):
+        # parse as an instance of the recognizer for the class, to return
+        # True or raise the failure
+        cls = self.__class__
+        self.__class__ = cls._recognizer_class()
+        try:
+            self.parse(text, *args, **kwargs)
+            return True
         finally:
-            self._memoization_cache = dict()
+            self.__class__ = cls
+
+    @classmethod
+    def _recognizer_class(cls):
+        if issubclass(cls, RecognizerMixin):
+            return cls
+        result = cls.__dict__.get('_recognizer_class_')
+        if result is None:
+            result = type(str(cls.__name__ + 'Recognizer'), (Recognizer, cls), {})
+            setattr(cls, '_recognizer_class_', result)
+        return result
 
     @classmethod
     def rule_list(cls):
@@ -80,58 +132,95 @@ class Parser(ParseContext):
     def result(self):
         return self.ast
 
-    def _call(self, rule):
-        name = rule.__name__.strip('_')
+    @classmethod
+    def _rule_table(cls):
+        # The rules of the class, sorted by name, and the dense integer id
+        # of each, computed once per class. The rules a subclass overrides
+        # are kept, as the override may call them through super().
+        table = cls.__dict__.get('_rule_table_')
+        if table is None:
+            infos = []
+            for klass in cls.__mro__:
+                for value in vars(klass).values():
+                    info = getattr(value, 'rule_info', None)
+                    if isinstance(info, RuleInfo) and info not in infos:
+                        infos.append(info)
+            infos.sort(key=lambda info: info.name)
+            table = (infos, {info: i for i, info in enumerate(infos)})
+            setattr(cls, '_rule_table_', table)
+        return table
+
+    def _reset_context(self, buffer=None, semantics=None):
+        # memo keys, memoization, and semantics are resolved once per
+        # parse, indexed by rule id
+        infos, self._rule_ids = self._rule_table()
+        self._rule_names = [info.name for info in infos]
+        super(Parser, self)._reset_context(buffer, semantics=semantics)
+        self._rule_memoize = [self._memoizes(info.name, info.memoize) for info in infos]
+        self._rule_semantics = [_UNRESOLVED] * len(infos)
+        self._rule_nodes = [info.node_type or self.ast_type for info in infos]
+        self._rule_cst = [not (self.ast_only and info.named) for info in infos]
+
+    def _call(self, info):
+        name = info.name
         self._rule_stack.append(name)
         pos = self._pos
         try:
-            self._trace_event('ENTER ')
+            if self.trace:
+                self._trace_event('ENTER ')
             self._last_node = None
-            node, newpos = self._invoke_rule(pos, rule, name)
+            node, newpos = self._invoke_rule(pos, info)
             self._goto(newpos)
-            self._trace_event('SUCCESS')
+            if self.trace:
+                self._trace_event('SUCCESS')
             self._add_cst_node(node)
             self._last_node = node
             return node
         except FailedParse:
-            self._trace_event('FAILED')
+            if self.trace:
+                self._trace_event('FAILED')
             self._goto(pos)
             raise
         finally:
             self._rule_stack.pop()
 
-    def _invoke_rule(self, pos, rule, name):
-        key = (pos, rule)
+    def _invoke_rule(self, pos, info):
+        name = info.name
+        i = self._rule_ids[info]
+        key = self._memo_keys[i]
         cache = self._memoization_cache
+        memoize = self._rule_memoize[i]
+        if memoize:
+            result = cache.get(pos, key)
+            if result is not None:
+                if isinstance(result, MemoFailure):
+                    self._raise_memo_failure(result)
+                return result
 
-        if key in cache:
-            result = cache[key]
-            if isinstance(result, Exception):
-                raise result
-            return result
-
-        self._push_ast()
+        self._push_ast(self._rule_nodes[i], self._rule_cst[i])
         try:
-            if name[0].islower():
+            if info.skip:
                 self._next_token()
-            rule(self)
+            info.func(self)
             node = self.ast
-            if not node:
+            if not node and self.cst is not NOCST:
                 node = self.cst
             elif '@' in node:
                 node = node['@']  # override the AST
             elif self.parseinfo:
                 node.add('parseinfo', ParseInfo(self._buffer, name, pos, self._pos))
-            semantic_rule = self._find_semantic_rule(name)
+            semantic_rule = self._rule_semantics[i]
+            if semantic_rule is _UNRESOLVED:
+                semantic_rule = self._rule_semantics[i] = self._find_semantic_rule(name)
             if semantic_rule:
-                try:
-                    node = semantic_rule(node)
-                except FailedSemantics as e:
-                    self._error(str(e), FailedParse)
-            cache[key] = result = (node, self._pos)
+                node = self._semantic_result(semantic_rule, node)
+            result = (node, self._pos)
+            if memoize:
+                cache.set(pos, key, result)
             return result
-        except Exception as e:
-            cache[key] = e
+        except FailedParseBase as e:
+            if memoize:
+                cache.set(pos, key, self._memo_failure(e))
             raise
         finally:
             self._pop_ast()
@@ -139,7 +228,7 @@ class Parser(ParseContext):
     def _token(self, token, node_name=None, force_list=False):
         self._next_token()
         if self._buffer.match(token) is None:
-            raise FailedToken(self._buffer, token)
+            raise self._failure(FailedToken, token)
         self._trace_match(token, node_name)
         self._add_ast_node(node_name, token, force_list)
         self._add_cst_node(token)
@@ -162,7 +251,7 @@ class Parser(ParseContext):
     def _pattern(self, pattern, node_name=None, force_list=False):
         token = self._buffer.matchre(pattern)
         if token is None:
-            raise FailedPattern(self._buffer, pattern)
+            raise self._failure(FailedPattern, pattern)
         self._trace_match(token, pattern)
         self._add_ast_node(node_name, token, force_list)
         self._add_cst_node(token)
@@ -197,12 +286,65 @@ class Parser(ParseContext):
     def _check_eof(self):
         self._next_token()
         if not self._buffer.atend():
-            raise FailedParse(self._buffer, 'Expecting end of text.')
+            self._error('Expecting end of text.')
+
+
+class Recognizer(RecognizerMixin, Parser):
+    """
+    The base of generated recognizers, and of the classes Parser.recognize()
+    parses with.
+    """
+    def _invoke_rule(self, pos, info):
+        i = self._rule_ids[info]
+        key = self._memo_keys[i]
+        cache = self._memoization_cache
+        memoize = self._rule_memoize[i]
+        if memoize:
+            result = cache.get(pos, key)
+            if result is not None:
+                if isinstance(result, MemoFailure):
+                    self._raise_memo_failure(result)
+                return result
+        try:
+            if info.skip:
+                self._next_token()
+            info.func(self)
+            result = (None, self._pos)
+            if memoize:
+                cache.set(pos, key, result)
+            return result
+        except FailedParseBase as e:
+            if memoize:
+                cache.set(pos, key, self._memo_failure(e))
+            raise
 
 
 # decorator
 def rule_def(rule):
+    info = RuleInfo(rule)
+
     @functools.wraps(rule)
     def wrapper(self):
-        return self._call(rule)
+        return self._call(info)
+    wrapper.rule_info = info
     return wrapper
+
+
+# decorator, applied before rule_def
+def nomemo(rule):
+    rule.memoize = False
+    return rule
+
+
+# decorator, applied before rule_def, for the rules with named elements
+def named_rule(rule):
+    rule.named = True
+    return rule
+
+
+# decorator, applied before rule_def
+def rule_node(node_type):
+    def decorator(rule):
+        rule.node_type = node_type
+        return rule
+    return decorator
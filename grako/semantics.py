@@ -108,12 +108,18 @@ class GrakoSemantics(object):
     def expre(self, ast):
         return ast
 
+    def decorator(self, ast):
+        return ast
+
     def rule(self, ast):
         ast_name = ast.ast_name
         name = ast.name
         rhs = ast.rhs
+        decorators = ast.decorators or []
         if not name in self.rules:
-            rule = grammars.Rule(name, rhs, ast_name=ast_name)
+            rule = grammars.Rule(name, rhs,
+                                 ast_name=ast_name,
+                                 memoize='nomemo' not in decorators)
             self.rules[name] = rule
         else:
             rule = self.rules[name]
@@ -7,6 +7,12 @@ from __future__ import print_function, division, absolute_import, unicode_litera
 if __name__ == '__main__':
     from . import bootstrap_tests
     from . import  buffering_test
+    from . import parsing_test
+    from . import grammars_test
+    from . import ast_test
 
     bootstrap_tests.main()
     buffering_test.main()
+    parsing_test.main()
+    grammars_test.main()
+    ast_test.main()
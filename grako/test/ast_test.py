@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the node types in grako.ast.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+import json
+import pickle
+import unittest
+from ..ast import AST, CompactAST, TypedAST
+
+
+class CompactASTTests(unittest.TestCase):
+
+    def test_add(self):
+        for ast_type in (AST, CompactAST):
+            node = ast_type()
+            node.add('name', 'a')
+            node.add('name', 'b')
+            node.add('items', 'x', force_list=True)
+            node['value'] = 1
+            self.assertEqual(['a', 'b'], node.name)
+            self.assertEqual(['x'], node['items'])
+            self.assertEqual(1, node.value)
+            self.assertIsNone(node.missing)
+            self.assertIsNone(node['missing'])
+            self.assertTrue('items' in node)
+            self.assertEqual(3, len(node))
+
+    def test_equality(self):
+        node = CompactAST(name='a')
+        node.add('items', CompactAST(value=1), force_list=True)
+        other = AST(name='a', items=[AST(value=1)])
+        self.assertEqual(other, node)
+        self.assertEqual(node, other)
+        self.assertNotEqual(node, CompactAST(name='b'))
+        self.assertEqual(node, pickle.loads(pickle.dumps(node)))
+
+    def test_shared_names(self):
+        a = CompactAST().add('x', 1).add('y', 2)
+        b = CompactAST().add('x', 3).add('y', 4)
+        self.assertIs(type(a), type(b))
+        c = b.copy().add('z', 5)
+        self.assertEqual(['x', 'y'], b.keys())
+        self.assertEqual([('x', 3), ('y', 4), ('z', 5)], c.items())
+        del c['x']
+        self.assertEqual(['y', 'z'], list(c))
+        self.assertRaises(AttributeError, getattr, c, '__deepcopy__')
+
+
+class Pair(TypedAST):
+    __slots__ = ('left', 'right')
+
+
+class TypedASTTests(unittest.TestCase):
+
+    def test_add(self):
+        node = Pair(left=1)
+        node.add('right', 2)
+        node.add('right', 3)
+        self.assertEqual((1, [2, 3]), (node.left, node.right))
+        self.assertTrue('left' in node)
+        self.assertFalse('@' in node)
+        self.assertIsNone(node.missing)
+        self.assertEqual([('left', 1), ('right', [2, 3])], node.items())
+        self.assertEqual(Pair(left=1, right=[2, 3]), node)
+        self.assertEqual(node, pickle.loads(pickle.dumps(node)))
+        self.assertRaises(AttributeError, node.add, 'missing', 1)
+
+    def test_asjson(self):
+        node = Pair(left=Pair(left=1), right=[2, 3])
+        self.assertEqual('{"left": {"left": 1, "right": null}, "right": [2, 3]}',
+                         json.dumps(node, default=TypedAST.asjson))
+
+    def test_empty(self):
+        node = Pair()
+        self.assertFalse(node)
+        self.assertEqual(2, len(node))
+        node.add('right', 0)
+        self.assertTrue(node)
+
+
+def suite():
+    loader = unittest.TestLoader()
+    return unittest.TestSuite([loader.loadTestsFromTestCase(CompactASTTests),
+                               loader.loadTestsFromTestCase(TypedASTTests)])
+
+
+def main():
+    unittest.TextTestRunner(verbosity=2).run(suite())
+
+if __name__ == '__main__':
+    main()
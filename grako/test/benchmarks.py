@@ -0,0 +1,920 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks for the parsing runtime. They are not part of the test
+suite. Run them with:
+
+    python -m grako.test.benchmarks [name...]
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+import os
+import sys
+import random
+import timeit
+import re as regexp
+from copy import deepcopy
+from ..buffering import Buffer
+from ..contexts import MemoCache, RuleMemoCache, MemoFailure
+from ..exceptions import FailedParse, FailedToken
+from ..parsing import Parser, rule_def
+from ..bootstrap import GrakoParser, COMMENTS_RE
+from ..tool import genmodel
+from .. import grammars
+from ..ast import AST, CompactAST, TypedAST
+
+THISDIR = os.path.dirname(os.path.abspath(__file__))
+BASEDIR = os.path.normpath(os.path.join(THISDIR, '../..'))
+
+BENCHMARKS = []
+
+
+def benchmark(f):
+    BENCHMARKS.append(f)
+    return f
+
+
+def grako_ebnf(times=1):
+    with open(os.path.join(BASEDIR, 'etc/grako.ebnf')) as f:
+        return f.read() * times
+
+
+def report(name, seconds, baseline=None):
+    if baseline:
+        print('    %-40s %8.4fs  (%.2fx)' % (name, seconds, baseline / seconds))
+    else:
+        print('    %-40s %8.4fs' % (name, seconds))
+
+
+def best_of(f, repeat=5):
+    return min(timeit.repeat(f, number=1, repeat=repeat))
+
+
+def token_ends(buf):
+    result = []
+    buf.goto(0)
+    while not buf.atend():
+        buf.next_token()
+        buf.matchre(r'[^\s(]+|.')
+        result.append(buf.pos)
+    return result
+
+
+def skip_all(buf, positions, skip):
+    for p in positions:
+        buf.goto(p)
+        skip(buf)
+
+
+def legacy_next_token(buf):
+    # The fixed-point loop next_token() used before the skip regex.
+    p = None
+    while buf._pos != p:
+        p = buf._pos
+        q, text, ws = p, buf.text, buf.whitespace
+        while q < buf._len and text[q] in ws:
+            q += 1
+        buf._pos = q
+        while buf.matchre(buf.comments_re):
+            pass
+
+
+def skip_re(buf):
+    buf._skip(buf._skip_re)
+
+
+@benchmark
+def next_token():
+    """skipping whitespace and comments between tokens"""
+    buf = Buffer(grako_ebnf(20), comments_re=COMMENTS_RE)
+    positions = token_ends(buf)
+    legacy = best_of(lambda: skip_all(buf, positions, legacy_next_token))
+    report('fixed-point eatwhitespace/eatcomments', legacy)
+    report('single skip regex', best_of(lambda: skip_all(buf, positions, skip_re)), legacy)
+    report('single skip regex, repeated (cached)', best_of(lambda: skip_all(buf, positions, Buffer.next_token)), legacy)
+
+
+def legacy_matchre(buf, pattern):
+    # Compiling on every call, as Buffer.matchre() did before the registry.
+    matched = regexp.compile(pattern, 0).match(buf.text, buf.pos)
+    if matched:
+        buf.goto(matched.end())
+        return matched.group()
+
+
+@benchmark
+def matchre():
+    """matching regular expressions at token positions"""
+    buf = Buffer(grako_ebnf(20), comments_re=COMMENTS_RE)
+    positions = token_ends(buf)
+    patterns = [r'[-_A-Za-z0-9]+', r'(.*?)(?=/\?)', r"([^'\\\n]|\\'|\\\\)*"]
+
+    def match_all(match):
+        for p in positions:
+            for pattern in patterns:
+                buf.goto(p)
+                match(buf, pattern)
+
+    legacy = best_of(lambda: match_all(legacy_matchre))
+    report('re.compile() per call', legacy)
+    report('pattern registry', best_of(lambda: match_all(Buffer.matchre)), legacy)
+
+
+def legacy_match(buf, token, ignorecase=False):
+    # Slicing the text on every attempt, as Buffer.match() did.
+    p = buf.pos
+    if ignorecase:
+        result = buf.text[p:p + len(token)].lower() == token.lower()
+    else:
+        result = buf.text[p:p + len(token)] == token
+    if result:
+        buf.move(len(token))
+        if not (buf.nameguard and token.isalnum() and buf.current().isalnum()):
+            return token
+    buf.goto(p)
+
+
+def synthetic_keywords(size):
+    keywords = ['BEGIN', 'END', 'IF', 'THEN', 'ELSE', 'WHILE', 'DO', 'RETURN']
+    words = keywords + ['x', 'y1', ':=', ';', '+', '(', ')']
+    rnd = random.Random(0)
+    result = []
+    length = 0
+    while length < size:
+        word = rnd.choice(words)
+        result.append(word)
+        length += len(word) + 1
+    return keywords, ' '.join(result)
+
+
+@benchmark
+def match():
+    """trying literal tokens at token positions"""
+    keywords, text = synthetic_keywords(1000000)
+    inputs = [
+        ('etc/grako.ebnf', grako_ebnf(20), ['=', ';', '|', '(', ')', '{', '}', '[', ']', '@', '>>', '$']),
+        ('1MB synthetic keywords', text, keywords),
+    ]
+    for name, text, tokens in inputs:
+        for ignorecase in (False, True):
+            buf = Buffer(text, comments_re=COMMENTS_RE)
+            positions = token_ends(buf)[:20000]
+
+            def match_all(match):
+                for p in positions:
+                    for token in tokens:
+                        buf.goto(p)
+                        match(buf, token, ignorecase)
+
+            print('  %s%s' % (name, ', ignorecase' if ignorecase else ''))
+            legacy = best_of(lambda: match_all(legacy_match))
+            report('slicing', legacy)
+            report('startswith', best_of(lambda: match_all(Buffer.match)), legacy)
+
+
+class LegacyMemoCache(dict):
+    # A single dict keyed by (pos, rule) that is scanned on every cut.
+    def get(self, pos, key):
+        return dict.get(self, (pos, key))
+
+    def set(self, pos, key, result):
+        self[(pos, key)] = result
+
+    def cut(self, pos):
+        for key in [k for k in self.keys() if k[0] < pos]:
+            del self[key]
+
+
+def parser_with_memo(memo_class, parser_class=GrakoParser):
+    class MemoParser(parser_class):
+        def _new_memo_cache(self):
+            return memo_class()
+    return MemoParser
+
+
+@benchmark
+def cut():
+    """parsing etc/grako.ebnf with memo pruning on cuts"""
+    for times in (10, 40):
+        text = grako_ebnf(times)
+        print('  etc/grako.ebnf x %d' % times)
+        legacy_parser = parser_with_memo(LegacyMemoCache)('Grako')
+        legacy = best_of(lambda: legacy_parser.parse(text), 3)
+        report('scan the whole cache on each cut', legacy)
+        parser = GrakoParser('Grako')
+        report('position buckets', best_of(lambda: parser.parse(text), 3), legacy)
+
+    def window(memo_class, size=5000, live=1000, rules=10):
+        cache = memo_class()
+        for pos in range(size):
+            for rule in range(rules):
+                cache.set(pos, rule, (None, pos))
+            cache.cut(pos - live)
+
+    print('  5000 positions, a live window of 1000')
+    legacy = best_of(lambda: window(LegacyMemoCache), 1)
+    report('scan the whole cache on each cut', legacy)
+    report('position buckets', best_of(lambda: window(MemoCache), 1), legacy)
+
+
+KEYWORDS = ['BEGIN', 'END', 'IF', 'THEN', 'ELSE', 'WHILE', 'DO', 'RETURN']
+
+
+class KeywordsParser(Parser):
+    # The same choice written with the OptionSucceeded exception protocol,
+    # and with the Choice.done flag that generated parsers now use.
+
+    @rule_def
+    def raising(self):
+        def block():
+            with self._choice():
+                for keyword in KEYWORDS:
+                    with self._option():
+                        self._token(keyword)
+                self._error('expecting a keyword')
+        self._closure(block)
+
+    @rule_def
+    def flagged(self):
+        def block():
+            with self._choice() as choice:
+                for keyword in KEYWORDS:
+                    with self._option(choice):
+                        self._token(keyword)
+                    if choice.done:
+                        break
+                if not choice.done:
+                    self._error('expecting a keyword')
+        self._closure(block)
+
+
+@benchmark
+def choice():
+    """a closure over a choice of eight keywords"""
+    rnd = random.Random(0)
+    inputs = [
+        ('first option matches', ' '.join(KEYWORDS[:1] * 20000)),
+        ('random keywords', ' '.join(rnd.choice(KEYWORDS) for _ in range(20000))),
+    ]
+    parser = KeywordsParser()
+    for name, text in inputs:
+        print('  %s' % name)
+        legacy = best_of(lambda: parser.parse(text, 'raising'), 3)
+        report('raise OptionSucceeded', legacy)
+        report('Choice.done flag', best_of(lambda: parser.parse(text, 'flagged'), 3), legacy)
+
+
+def generated_parser(inline):
+    model = genmodel('Grako', grako_ebnf())
+    namespace = {}
+    exec(model.codegen(inline=inline), namespace)
+    return namespace['GrakoParser']
+
+
+@benchmark
+def inline():
+    """parsing etc/grako.ebnf x 20 with generated parsers"""
+    text = grako_ebnf(20)
+    parsers = [('context managers', generated_parser(False)()),
+               ('straight-line code', generated_parser(True)())]
+    baseline = None
+    for name, parser in parsers:
+        seconds = best_of(lambda: parser.parse(text, 'grammar', comments_re=COMMENTS_RE), 3)
+        report(name, seconds, baseline)
+        baseline = baseline or seconds
+
+
+def without_dispatch(model):
+    for rule in model.rules:
+        for node in rule.nodes():
+            node._option_chars = node._dispatch = None
+    return model
+
+
+@benchmark
+def dispatch():
+    """a choice of 40 keywords, with and without first-character dispatch"""
+    rnd = random.Random(0)
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    keywords = sorted(set(''.join(rnd.choice(letters) for _ in range(rnd.randint(2, 8)))
+                          for _ in range(40)))
+    grammar = 'start = {keyword}+ $ ;\nkeyword = %s ;' % ' | '.join("'%s'" % k for k in keywords)
+    text = ' '.join(rnd.choice(keywords) for _ in range(5000))
+    results = []
+    for model in (without_dispatch(genmodel('Keywords', grammar)), genmodel('Keywords', grammar)):
+        namespace = {}
+        exec(model.codegen(), namespace)
+        parser = namespace['KeywordsParser']()
+        results.append((best_of(lambda: parser.parse(text, 'start'), 3),
+                        best_of(lambda: model.parse(text, 'start'), 3)))
+    (generated, interpreted), (dispatched, dispatched_model) = results
+    print('  generated parser')
+    report('try every option', generated)
+    report('dispatch on the next character', dispatched, generated)
+    print('  grammar model')
+    report('try every option', interpreted)
+    report('dispatch on the next character', dispatched_model, interpreted)
+
+
+class LegacyFailedToken(FailedParse):
+    # The failures as they were built before they were reused.
+    def __init__(self, buf, token):
+        super(LegacyFailedToken, self).__init__(buf, token)
+        self.token = token
+
+
+class EagerChoice(grammars.Choice):
+    # Choice.parse as it was, formatting its error message on every failure.
+    def parse(self, ctx):
+        with ctx._choice() as choice:
+            for o in self.options:
+                with ctx._option(choice):
+                    o.parse(ctx)
+                if choice.done:
+                    return
+            firstset = ' '.join(str(grammars.urepr(f[0])) for f in self.firstset if f)
+            if firstset:
+                raise FailedParse(ctx.buf, 'one of {%s}' % firstset)
+            raise FailedParse(ctx.buf, 'no available options')
+
+
+@benchmark
+def failures():
+    """failures that backtracking discards"""
+    parser = Parser()
+    parser._reset_context(Buffer('text'))
+
+    def fail(f, times=100000):
+        for _ in range(times):
+            try:
+                raise f()
+            except FailedParse:
+                pass
+
+    print('  100000 token failures')
+    legacy = best_of(lambda: fail(lambda: LegacyFailedToken(parser._buffer, 'x')))
+    report('a new exception per failure', legacy)
+    report('reused failures', best_of(lambda: fail(lambda: parser._failure(FailedToken, 'x'))), legacy)
+
+    rnd = random.Random(0)
+    groups = [['%s%d' % (c, i) for c in 'ABCD'] for i in range(10)]
+    grammar = 'start = {item}+ $ ;\nitem = %s ;\n' % ' | '.join('g%d' % i for i in range(10))
+    grammar += ''.join('g%d = %s ;\n' % (i, ' | '.join("'%s'" % w for w in group))
+                       for i, group in enumerate(groups))
+    text = ' '.join(rnd.choice(rnd.choice(groups)) for _ in range(5000))
+    model = without_dispatch(genmodel('Groups', grammar))
+    eager = without_dispatch(genmodel('Groups', grammar))
+    for rule in eager.rules:
+        for node in rule.nodes():
+            if isinstance(node, grammars.Choice):
+                node.__class__ = EagerChoice
+    print('  grammar model, a choice of ten choices of four keywords')
+    legacy = best_of(lambda: eager.parse(text))
+    report('choice messages formatted on failure', legacy)
+    report('choice messages formatted on demand', best_of(lambda: model.parse(text)), legacy)
+
+
+class LegacyMemoFailures(object):
+    # Parser._invoke_rule as it was, storing the exception itself in the
+    # memo cache and raising it again on a hit.
+    def _failure(self, etype, item, pos=None):
+        return etype(self._buffer, item)
+
+    def _invoke_rule(self, pos, info):
+        cache = self._memoization_cache
+        result = cache.get(pos, info.func)
+        if result is not None:
+            if isinstance(result, Exception):
+                raise result
+            return result
+        self._push_ast()
+        try:
+            if info.skip:
+                self._next_token()
+            info.func(self)
+            node = self.ast or self.cst
+            result = (node, self._pos)
+            cache.set(pos, info.func, result)
+            return result
+        except Exception as e:
+            cache.set(pos, info.func, e)
+            raise
+        finally:
+            self._pop_ast()
+
+
+def failing_grammar():
+    # Most rule invocations fail, and there are no cuts, so every memo
+    # is kept to the end of the parse.
+    grammar = 'start = {item}+ $ ;\nitem = %s ;\n' % ' | '.join('a%d' % i for i in range(4))
+    grammar += ''.join("a%d = name name name '%d' ;\n" % (i, i) for i in range(4))
+    grammar += 'name = ?/[a-z]+/? ;\n'
+    rnd = random.Random(0)
+    text = ' '.join('x y z %d' % rnd.randint(0, 3) for _ in range(5000))
+    return genmodel('Failing', grammar), text
+
+
+@benchmark
+def memo_failures():
+    """memory held by the memo cache when most rule invocations fail"""
+    import tracemalloc
+    model, text = failing_grammar()
+    namespace = {}
+    exec(model.codegen(), namespace)
+    Parser = namespace['FailingParser']
+    Legacy = type(str('LegacyParser'), (LegacyMemoFailures, Parser), {})
+    peaks = []
+    for name, parser_class in [('exceptions with their tracebacks', Legacy),
+                               ('failure records', Parser)]:
+        parser = parser_class()
+        tracemalloc.start()
+        parser.parse(text, 'start')
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        peaks.append(peak)
+        seconds = best_of(lambda: parser.parse(text, 'start'), 3)
+        print('    %-40s %8.1fMB %8.4fs' % (name, peak / 2 ** 20, seconds))
+    print('    %-40s %8.1fx' % ('peak memory reduction', peaks[0] / peaks[1]))
+
+
+class LegacyRuleCalls(object):
+    # Parser._call and _invoke_rule as they were, working out the name,
+    # memoization, whitespace skipping, and semantics on every call.
+    def _call(self, info):
+        rule = info.func
+        name = rule.__name__.strip('_')
+        self._rule_stack.append(name)
+        pos = self._pos
+        try:
+            self._trace_event('ENTER ')
+            self._last_node = None
+            node, newpos = self._legacy_invoke_rule(pos, rule, name)
+            self._goto(newpos)
+            self._trace_event('SUCCESS')
+            self._add_cst_node(node)
+            self._last_node = node
+            return node
+        except FailedParse:
+            self._trace_event('FAILED')
+            self._goto(pos)
+            raise
+        finally:
+            self._rule_stack.pop()
+
+    def _legacy_invoke_rule(self, pos, rule, name):
+        cache = self._memoization_cache
+        memoize = self._memoizes(name, getattr(rule, 'memoize', True))
+        if memoize:
+            result = cache.get(pos, rule)
+            if result is not None:
+                if isinstance(result, MemoFailure):
+                    self._raise_memo_failure(result)
+                return result
+        self._push_ast()
+        try:
+            if name[0].islower():
+                self._next_token()
+            rule(self)
+            node = self.ast or self.cst
+            semantic_rule = self._find_semantic_rule(name)
+            if semantic_rule:
+                node = semantic_rule(node)
+            result = (node, self._pos)
+            if memoize:
+                cache.set(pos, rule, result)
+            return result
+        except FailedParse as e:
+            if memoize:
+                cache.set(pos, rule, self._memo_failure(e))
+            raise
+        finally:
+            self._pop_ast()
+
+
+@benchmark
+def rule_calls():
+    """parsing etc/grako.ebnf x 20 with a generated parser"""
+    text = grako_ebnf(20)
+    namespace = {}
+    exec(genmodel('Grako', grako_ebnf()).codegen(), namespace)
+    Parser = namespace['GrakoParser']
+    Legacy = type(str('LegacyParser'), (LegacyRuleCalls, Parser), {})
+    semantics = namespace['GrakoSemantics']()
+
+    def parse(parser_class):
+        return parser_class().parse(text, 'grammar', semantics=semantics, comments_re=COMMENTS_RE)
+
+    legacy = best_of(lambda: parse(Legacy), 3)
+    report('work out each rule on every call', legacy)
+    report('per-class rule table', best_of(lambda: parse(Parser), 3), legacy)
+
+
+class TracingMemoCache(MemoCache):
+    # Records the memo lookups, stores, and cuts of a parse, to replay
+    # them. Cuts are recorded with a key of None.
+    trace = []
+
+    def get(self, pos, key):
+        self.trace.append((pos, key, None))
+        return super(TracingMemoCache, self).get(pos, key)
+
+    def set(self, pos, key, result):
+        self.trace.append((pos, key, result))
+        super(TracingMemoCache, self).set(pos, key, result)
+
+    def cut(self, pos):
+        self.trace.append((pos, None, None))
+        super(TracingMemoCache, self).cut(pos)
+
+
+def cutting_grammar(rules=100):
+    # Items start with a keyword that selects one of many rules, which
+    # cuts after it, and go on with names, so each cut discards the memos
+    # of every rule at the start of the item and those of a single rule
+    # at many other positions.
+    grammar = 'start = {item}+ $ ;\nitem = %s ;\n' % ' | '.join('a%d' % i for i in range(rules))
+    grammar += ''.join("a%d = 'k%d' >> {name} ';' ;\n" % (i, i) for i in range(rules))
+    grammar += 'name = ?/[a-z]+/? ;\n'
+    rnd = random.Random(0)
+    text = ' '.join('k%d a b c d e f g h i j ;' % rnd.randint(0, rules - 1) for _ in range(1000))
+    return genmodel('Cutting', grammar), text
+
+
+@benchmark
+def memo_store():
+    """memo lookup time and memory, by position or by rule"""
+    import tracemalloc
+
+    def replay(cache, trace):
+        get, set, cut = cache.get, cache.set, cache.cut
+        for pos, key, result in trace:
+            if key is None:
+                cut(pos)
+            elif result is None:
+                get(pos, key)
+            else:
+                set(pos, key, result)
+        return cache
+
+    for title, (model, text) in [('many failures and no cuts', failing_grammar()),
+                                 ('%d rules and a cut per item' % 100, cutting_grammar(100))]:
+        namespace = {}
+        exec(model.codegen(), namespace)
+        Parser = namespace['%sParser' % model.name]
+        TracingMemoCache.trace = trace = []
+        parser = parser_with_memo(TracingMemoCache, Parser)()
+        parser.parse(text, 'start')
+        names = list(parser._rule_names)
+        ids = dict((name, i) for i, name in enumerate(names))
+        by_id = [(pos, ids.get(key), result) for pos, key, result in trace]
+        cuts = sum(1 for _, key, _ in trace if key is None)
+
+        print('  %s: replaying the %d memo operations and %d cuts of a parse' %
+              (title, len(trace) - cuts, cuts))
+        stores = [('(pos, name) keys in a single dict', LegacyMemoCache, trace),
+                  ('name keys in position buckets', MemoCache, trace),
+                  ('position keys in rule dicts', lambda: RuleMemoCache(len(names)), by_id)]
+        legacy = None
+        for name, cache_class, ops in stores:
+            tracemalloc.start()
+            cache = replay(cache_class(), ops)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            del cache
+            seconds = best_of(lambda: replay(cache_class(), ops), 15)
+            legacy = legacy or seconds
+            print('    %-40s %8.4fs  (%.2fx) %8.1fKB peak' %
+                  (name, seconds, legacy / seconds, peak / 2 ** 10))
+
+        print('  %s: parsing with the generated parser' % title)
+        legacy = None
+        for store in ('position', 'rule'):
+            parser = Parser(memo_store=store)
+            seconds = best_of(lambda: parser.parse(text, 'start'), 3)
+            report('memo_store=%r' % store, seconds, legacy)
+            legacy = legacy or seconds
+
+
+@benchmark
+def ast_type():
+    """AST nodes as dicts and as CompactAST"""
+    import tracemalloc
+
+    def build(ast_type, count=100000):
+        return [ast_type().add('name', i).add('items', i, True).add('value', i)
+                for i in range(count)]
+
+    def read(nodes):
+        for node in nodes:
+            node.name, node.items, node.value, node.add
+
+    print('  100000 nodes with three names')
+    results = []
+    for ast_type in (AST, CompactAST):
+        tracemalloc.start()
+        nodes = build(ast_type)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results.append((ast_type.__name__, size, best_of(lambda: build(ast_type), 3),
+                        best_of(lambda: read(nodes))))
+    print('    %-20s %10s %10s %10s' % ('', 'memory', 'build', 'read'))
+    for name, size, built, read in results:
+        print('    %-20s %8.1fMB %9.4fs %9.4fs' % (name, size / 2 ** 20, built, read))
+
+    text = grako_ebnf(20)
+    namespace = {}
+    exec(genmodel('Grako', grako_ebnf()).codegen(), namespace)
+    Parser = namespace['GrakoParser']
+    print('  parsing etc/grako.ebnf x 20 with a generated parser')
+    legacy = None
+    for ast_type in (AST, CompactAST):
+        parser = Parser(ast_type=ast_type)
+        seconds = best_of(lambda: parser.parse(text, 'grammar', comments_re=COMMENTS_RE), 3)
+        report(ast_type.__name__, seconds, legacy)
+        legacy = legacy or seconds
+
+
+@benchmark
+def node_types():
+    """ASTs as dicts and as generated node classes"""
+    import tracemalloc
+    text = grako_ebnf(20)
+    model = genmodel('Grako', grako_ebnf())
+
+    def walk(node):
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+        elif isinstance(node, (dict, TypedAST)):
+            for name in node.keys():
+                walk(node[name])
+
+    print('  parsing etc/grako.ebnf x 20 with a generated parser, and walking the result')
+    print('    %-20s %10s %10s %10s' % ('', 'memory', 'parse', 'walk'))
+    for name, nodes in [('AST', False), ('node classes', True)]:
+        namespace = {}
+        exec(model.codegen(nodes=nodes), namespace)
+        parser = namespace['GrakoParser']()
+
+        def parse():
+            return parser.parse(text, 'grammar', comments_re=COMMENTS_RE)
+        tracemalloc.start()
+        result = parse()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('    %-20s %8.1fMB %9.4fs %9.4fs' % (name, size / 2 ** 20, best_of(parse, 3),
+                                                 best_of(lambda: walk(result))))
+
+
+@benchmark
+def recognize():
+    """validating etc/grako.ebnf x 20 without building trees"""
+    text = grako_ebnf(20)
+    model = genmodel('Grako', grako_ebnf())
+    parsers = []
+    for recognizer in (False, True):
+        namespace = {}
+        exec(model.codegen(recognizer=recognizer), namespace)
+        parsers.append(namespace['GrakoParser']())
+    parser, recognizer = parsers
+
+    print('  generated parser')
+    legacy = best_of(lambda: parser.parse(text, 'grammar', comments_re=COMMENTS_RE), 3)
+    report('parse()', legacy)
+    report('recognize()', best_of(lambda: parser.recognize(text, 'grammar', comments_re=COMMENTS_RE), 3), legacy)
+    report('generated recognizer', best_of(lambda: recognizer.parse(text, 'grammar', comments_re=COMMENTS_RE), 3), legacy)
+
+    print('  grammar model')
+    legacy = best_of(lambda: model.parse(text, 'grammar', comments_re=COMMENTS_RE), 3)
+    report('parse()', legacy)
+    report('recognize()', best_of(lambda: model.recognize(text, 'grammar', comments_re=COMMENTS_RE), 3), legacy)
+
+
+@benchmark
+def ast_only():
+    """parsing without building the CST of rules with named elements"""
+    import tracemalloc
+    grammar = """
+        start = {record}+ $ ;
+        record = key:name '=' value:(name | number) ['(' notes:{name}+ ')'] ';' ;
+        name = ?/[a-z]+/? ;
+        number = ?/[0-9]+/? ;
+    """
+    rnd = random.Random(0)
+    text = ' '.join('%s = %d (a b c d);' % ('x' * rnd.randint(1, 5), rnd.randint(0, 999))
+                    for _ in range(10000))
+    cases = [('records', genmodel('Records', grammar), text, 'start', {}),
+             ('etc/grako.ebnf x 20', genmodel('Grako', grako_ebnf()), grako_ebnf(20), 'grammar',
+              dict(comments_re=COMMENTS_RE))]
+    for title, model, text, start, kwargs in cases:
+        namespace = {}
+        exec(model.codegen(), namespace)
+        Parser = namespace[model.name + 'Parser']
+        print('  %s' % title)
+        legacy = None
+        for ast_only in (False, True):
+            parser = Parser(ast_only=ast_only)
+            tracemalloc.start()
+            parser.parse(text, start, **kwargs)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            seconds = best_of(lambda: parser.parse(text, start, **kwargs), 3)
+            name = 'ast_only=%s, peak %.1fMB' % (ast_only, peak / 2 ** 20)
+            report(name, seconds, legacy)
+            legacy = legacy or seconds
+
+
+class LegacyUpdateAST(object):
+    # ParseContext._update_ast as it was, which fails on names that are
+    # also AST methods, such as items.
+    def _update_ast(self, ast):
+        for key, value in ast.items():
+            if key not in self.ast or not isinstance(value, list):
+                self._add_ast_node(key, value)
+            else:
+                prev = self.ast[key]
+                if isinstance(prev, list):
+                    prev.extend(value)
+                else:
+                    self.ast[key] = [prev] + value
+
+
+@benchmark
+def ast_merge():
+    """accumulating named elements in a closure"""
+    grammar = '''
+        start = {items+:item} $ ;
+        legacy = {elements+:item} $ ;
+        item = ?/[a-z]+/? ;
+    '''
+    namespace = {}
+    exec(genmodel('Merge', grammar).codegen(), namespace)
+    Parser = namespace['MergeParser']
+    Legacy = type(str('LegacyParser'), (LegacyUpdateAST, Parser), {})
+    for size in (25000, 50000, 100000):
+        text = ' '.join(['ab'] * size)
+        print('  %d elements' % size)
+        legacy = best_of(lambda: Legacy().parse(text, 'legacy'), 3)
+        report('merge through items() (as elements)', legacy)
+        seconds = best_of(lambda: Parser().parse(text, 'start'), 3)
+        report('merge in place', seconds, legacy)
+        print('    %-40s %8.2fus' % ('per element', seconds / size * 1e6))
+
+
+class LegacyTries(object):
+    # push an AST for every option and closure iteration
+    def _enter_try(self, ast=True):
+        return super(LegacyTries, self)._enter_try()
+
+
+@benchmark
+def unnamed_tries():
+    """options and closure iterations without named elements"""
+    grammar = '''
+        start = {item}+ $ ;
+        item = (word | number) [',' | ';'] ;
+        word = ?/[a-z]+/? ;
+        number = ?/[0-9]+/? ;
+    '''
+    rnd = random.Random(0)
+    text = ' '.join(rnd.choice(['abc', '123', 'de,', '45;']) for _ in range(50000))
+    cases = [('50000 items', genmodel('Items', grammar), text, 'start', {}),
+             ('etc/grako.ebnf x 20', genmodel('Grako', grako_ebnf()), grako_ebnf(20), 'grammar',
+              dict(comments_re=COMMENTS_RE))]
+    for title, model, text, start, kwargs in cases:
+        print('  %s' % title)
+        for inline in (False, True):
+            namespace = {}
+            exec(model.codegen(inline=inline), namespace)
+            Parser = namespace[model.name + 'Parser']
+            Legacy = type(str('LegacyParser'), (LegacyTries, Parser), {})
+            kind = 'inline' if inline else 'context managers'
+            legacy = best_of(lambda: Legacy().parse(text, start, **kwargs), 3)
+            report('%s, an AST per try' % kind, legacy)
+            seconds = best_of(lambda: Parser().parse(text, start, **kwargs), 3)
+            report('%s, checkpoints' % kind, seconds, legacy)
+
+
+class CountingSemantics(object):
+    # a semantic action for every rule, which does some work and counts
+    # its calls
+    def __init__(self, semantics=None, work=0):
+        self.semantics = semantics
+        self.work = work
+        self.calls = 0
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        action = getattr(self.semantics, name, None)
+
+        def count(ast):
+            self.calls += 1
+            sum(range(self.work))
+            return action(ast) if action else ast
+        return count
+
+
+@benchmark
+def defer_semantics():
+    """semantic actions run only on the final parse path"""
+    from ..semantics import GrakoSemantics
+    grammar = '''
+        start = {stmt}+ $ ;
+        stmt = expression ';' | assignment ';' ;
+        call = name '(' [args] ')' ;
+        assignment = name '=' expression ;
+        expression = term {('+' | '-') term} ;
+        term = call | name | number ;
+        args = expression {',' expression} ;
+        name = ?/[a-z]+/? ;
+        number = ?/[0-9]+/? ;
+    '''
+    rnd = random.Random(0)
+    stmts = ['f(a, b + 1);', 'x = y + g(2) - 3;', 'a + b - c;', 'x = 1;', 'h();']
+    text = ' '.join(rnd.choice(stmts) for _ in range(5000))
+    stmts = genmodel('Stmts', grammar)
+    cases = [('5000 statements, cheap actions', stmts, text, 'start', {}, None, 0),
+             ('5000 statements, costly actions', stmts, text, 'start', {}, None, 2000),
+             ('etc/grako.ebnf x 20', genmodel('Grako', grako_ebnf()), grako_ebnf(20), 'grammar',
+              dict(comments_re=COMMENTS_RE), lambda: GrakoSemantics('Grako'), 0)]
+    for title, model, text, start, kwargs, semantics, work in cases:
+        namespace = {}
+        exec(model.codegen(), namespace)
+        Parser = namespace[model.name + 'Parser']
+        print('  %s' % title)
+        legacy = None
+        for defer in (False, True):
+            counting = CountingSemantics(semantics and semantics(), work)
+            Parser(defer_semantics=defer).parse(text, start, semantics=counting, **kwargs)
+
+            def parse():
+                counting = CountingSemantics(semantics and semantics(), work)
+                Parser(defer_semantics=defer).parse(text, start, semantics=counting, **kwargs)
+            seconds = best_of(parse, 3)
+            report('defer_semantics=%s, %d calls' % (defer, counting.calls), seconds, legacy)
+            legacy = legacy or seconds
+
+
+def synthetic_grammar(size, seed=0):
+    # Rules mostly reference the ones defined after them, as in grammars
+    # written top-down, with a few references back up, and most options
+    # start with a keyword.
+    rnd = random.Random(seed)
+    tokens = ['t%d' % i for i in range(200)]
+
+    def element(i):
+        if rnd.random() < 0.5:
+            return grammars.Token(rnd.choice(tokens))
+        j = rnd.randint(i + 1, i + 20) if rnd.random() < 0.95 else rnd.randint(0, i)
+        ref = grammars.RuleRef('r%d' % min(j, size - 1))
+        return grammars.Optional(ref) if rnd.random() < 0.2 else ref
+
+    rules = []
+    for i in range(size):
+        options = []
+        for _ in range(rnd.randint(2, 4)):
+            sequence = [element(i) for _ in range(rnd.randint(1, 3))]
+            if rnd.random() < 0.6:
+                sequence.insert(0, grammars.Token(rnd.choice(tokens)))
+            options.append(grammars.Sequence(sequence))
+        rules.append(grammars.Rule('r%d' % i, grammars.Choice(options)))
+    return grammars.Grammar('Synthetic', rules)
+
+
+def legacy_first_sets(grammar, k):
+    # The fixed-point loop that copied the whole map on each iteration.
+    F = dict()
+    while True:
+        F1 = deepcopy(F)
+        for rule in grammar.rules:
+            F[rule.name] = F.get(rule.name, set()) | rule._first(k, F)
+        if F1 == F:
+            break
+    return F
+
+
+@benchmark
+def first_sets():
+    """FIRST sets of a synthetic grammar"""
+    for size, k in [(300, 1), (300, 2), (1500, 1), (1500, 2)]:
+        grammar = synthetic_grammar(size)
+        print('  %d rules, k=%d' % (size, k))
+        legacy = best_of(lambda: legacy_first_sets(grammar, k), 1)
+        report('copy the map on each iteration', legacy)
+
+        def worklist():
+            grammar._first_cache = {}
+            return grammar.calc_first_sets(k)
+        report('worklist', best_of(worklist, 3), legacy)
+        assert worklist() == legacy_first_sets(grammar, k)
+
+
+def main(names=None):
+    for f in BENCHMARKS:
+        if names and f.__name__ not in names:
+            continue
+        print('%s: %s' % (f.__name__, f.__doc__))
+        f()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -6,8 +6,10 @@ grako.buffering.Buffer.
 from __future__ import print_function, division, absolute_import, unicode_literals
 import os
 import random
+import tempfile
 import unittest
-from ..buffering import Buffer
+from ..buffering import Buffer, FileBuffer
+from ..exceptions import FailedParse
 
 THISDIR = os.path.dirname(os.path.abspath(__file__))
 BASEDIR = os.path.normpath(os.path.join(THISDIR, '../..'))
@@ -59,8 +61,151 @@ class BufferingTests(unittest.TestCase):
         for n, line in enumerate(lines):
             self.assertEqual(line, self.buf.get_line(n))
 
+    def test_next_token(self):
+        buf = Buffer(' (* one *)\n\t(* two\n*) x', comments_re=r'\(\*(?:.|\n)*?\*\)')
+        buf.next_token()
+        self.assertEqual('x', buf.current())
+        buf.next_token()
+        self.assertEqual(len(buf.text) - 1, buf.pos)
+        buf.goto(0)
+        buf.next_token()
+        self.assertEqual(len(buf.text) - 1, buf.pos)
+        self.assertEqual(1, buf.skip_cache_hits)
+
+    def test_comments_with_inline_flags(self):
+        buf = Buffer('# one\n  # two\nx', comments_re='(?m)#.*$')
+        buf.next_token()
+        self.assertEqual('x', buf.current())
+        buf = Buffer(' /* one\n two */ x', comments_re=r'(?s)/\*.*?\*/')
+        buf.next_token()
+        self.assertEqual('x', buf.current())
+
+    def test_skip_methods(self):
+        # next_token() calls the skipping methods subclasses override
+        class DashBuffer(Buffer):
+            def eatcomments(self):
+                while self.current() == '-':
+                    self.next()
+
+        buf = DashBuffer(' -- - x')
+        buf.next_token()
+        self.assertEqual('x', buf.current())
+        buf = Buffer(' -- - x')
+        buf.next_token()
+        self.assertEqual('-', buf.current())
+
+    def test_match(self):
+        buf = Buffer('IN INITIAL in')
+        self.assertEqual('IN', buf.match('IN'))
+        buf.next_token()
+        self.assertIsNone(buf.match('IN'))
+        self.assertEqual(3, buf.pos)
+        self.assertIsNone(buf.match('in', ignorecase=True))
+        buf.goto(11)
+        self.assertIsNone(buf.match('IN'))
+        self.assertEqual('IN', buf.match('IN', ignorecase=True))
+        self.assertTrue(buf.atend())
+
+    def test_matchre_ignorecase(self):
+        buf = Buffer('ABC abc')
+        self.assertIsNone(buf.matchre('abc'))
+        self.assertEqual('ABC', buf.matchre('abc', ignorecase=True))
+        buf = Buffer('ABC abc', ignorecase=True)
+        self.assertEqual('ABC', buf.matchre('abc'))
+
+    def test_lazy_line_cache(self):
+        while self.buf.matchre(r'\S*\s'):
+            pass
+        self.assertIsNone(self.buf._linecache)
+        self.assertEqual(self.text.count('\n'), self.buf.linecount)
+        self.assertIsNotNone(self.buf._linecache)
+        # offsets past 2GB fit
+        self.buf._linecache.append(2 ** 40)
+
+
+class FileBufferingTests(BufferingTests):
+
+    def setUp(self):
+        super(FileBufferingTests, self).setUp()
+        self.buf = FileBuffer(os.path.join(BASEDIR, 'etc/test_text'), whitespace='')
+
+    def tearDown(self):
+        self.buf.close()
+
+    def buffers(self, text, **kwargs):
+        # a Buffer and a FileBuffer over the same text
+        f = tempfile.NamedTemporaryFile(delete=False)
+        with f:
+            f.write(text.encode('utf-8'))
+        self.addCleanup(os.remove, f.name)
+        buf = FileBuffer(f.name, **kwargs)
+        self.addCleanup(buf.close)
+        return Buffer(text, **kwargs), buf
+
+    def test_match_ignorecase_unicode(self):
+        for buf in self.buffers('hé ÉTÉ'):
+            self.assertEqual('HÉ', buf.match('HÉ', ignorecase=True))
+            buf.next_token()
+            self.assertEqual('été', buf.match('été', ignorecase=True))
+            self.assertTrue(buf.atend())
+
+    def test_unicode_agreement(self):
+        # tokens, whitespace, and line information are the same, but for
+        # positions, which are byte offsets in a FileBuffer
+        buf, fbuf = self.buffers('éé É\nx')
+        for b in (buf, fbuf):
+            self.assertEqual('éé', b.match('éé'))
+            b.next_token()
+            self.assertEqual('É', b.match('É', ignorecase=True))
+            b.next_token()
+            self.assertEqual('x', b.current())
+            self.assertEqual((1, 0), b.line_info()[1:3])
+            self.assertEqual('éé É', b.get_line(0))
+        self.assertEqual((5, 8), (buf.pos, fbuf.pos))
+
+    def test_unicode_differences(self):
+        # patterns are matched against the bytes in a FileBuffer
+        buf, fbuf = self.buffers('ééÉ')
+        for pattern, ignorecase, expected, fexpected in [
+                (r'\w+', False, 'ééÉ', None),  # \w is ASCII only
+                ('é+', False, 'éé', 'é'),  # + repeats the last byte
+                ('.', False, 'é', '\ufffd'),  # . matches a byte
+                ('[éa]', False, 'é', '\ufffd'),  # classes match bytes
+                ('ÉÉ', True, 'éé', None)]:  # IGNORECASE folds ASCII only
+            buf.goto(0)
+            fbuf.goto(0)
+            self.assertEqual(expected, buf.matchre(pattern, ignorecase=ignorecase))
+            self.assertEqual(fexpected, fbuf.matchre(pattern, ignorecase=ignorecase))
+
+    def test_unicode_whitespace(self):
+        # '\u00a1' starts with the same byte as '\u00a0'
+        for buf in self.buffers(' \u00a0\u00a1', whitespace=' \u00a0'):
+            buf.next_token()
+            self.assertEqual('\u00a1', buf.current())
+
+    def test_parse_consistency(self):
+        from ..bootstrap import GrakoParser, COMMENTS_RE
+        filename = os.path.join(BASEDIR, 'etc/grako.ebnf')
+        with open(filename) as f:
+            expected = GrakoParser('Grako').parse(f.read())
+        with FileBuffer(filename, comments_re=COMMENTS_RE) as buf:
+            self.assertEqual(expected, GrakoParser('Grako').parse(buf))
+
+    def test_failure_after_close(self):
+        from ..bootstrap import GrakoParser
+        _, buf = self.buffers('a = "a" ;\nb = ;\n')
+        with buf:
+            with self.assertRaises(FailedParse) as context:
+                GrakoParser('Grako').parse(buf)
+        message = str(context.exception)
+        self.assertIn('(2:', message)
+        self.assertIn('b = ;', message)
+
+
 def suite():
-    return unittest.TestLoader().loadTestsFromTestCase(BufferingTests)
+    loader = unittest.TestLoader()
+    return unittest.TestSuite([loader.loadTestsFromTestCase(BufferingTests),
+                               loader.loadTestsFromTestCase(FileBufferingTests)])
 
 def main():
     unittest.TextTestRunner(verbosity=2).run(suite())
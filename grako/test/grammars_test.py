@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the analysis of grammar models in grako.grammars.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+import unittest
+from ..tool import genmodel
+
+EXPRESSIONS_GRAMMAR = '''
+    start = expr $ ;
+    expr = term {('+' | '-') term} ;
+    term = sign atom ;
+    sign = ['-'] ;
+    atom = 'x' | '(' expr ')' ;
+    xs = {'x'} ;
+'''
+
+
+class FirstFollowTests(unittest.TestCase):
+
+    def setUp(self):
+        self.model = genmodel('Expressions', EXPRESSIONS_GRAMMAR)
+
+    def test_first(self):
+        F = self.model.first_sets
+        self.assertEqual({('x',), ('(',)}, F['atom'])
+        self.assertEqual({('-',), ('x',), ('(',)}, F['start'])
+        self.assertEqual({'sign', 'xs'}, self.model.nullable)
+
+    def test_first_k(self):
+        F = self.model.calc_first_sets(2)
+        self.assertEqual({('x',), ('(', 'x'), ('(', '('), ('(', '-')}, F['atom'])
+        self.assertEqual({(), ('x',), ('x', 'x')}, F['xs'])
+        self.assertEqual({(), ('-',)}, F['sign'])
+        self.assertIs(F, self.model.calc_first_sets(2))
+
+    def test_follow(self):
+        FL = self.model.follow_sets
+        self.assertEqual({(), (')',)}, FL['expr'])
+        self.assertEqual({(), (')',), ('+',), ('-',)}, FL['atom'])
+        self.assertEqual({('x',), ('(',)}, FL['sign'])
+        FL = self.model.calc_follow_sets(2)
+        self.assertEqual({(), (')',), (')', ')'), (')', '+'), (')', '-')}, FL['expr'])
+        self.assertTrue({('x',), ('x', '+'), ('(', 'x')} <= FL['sign'])
+
+    def test_closure_of_nullable(self):
+        model = genmodel('Empty', "start = {['x']} $ ;")
+        self.assertTrue(() in model.rules[0].exp.sequence[0].exp.firstset)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(FirstFollowTests)
+
+
+def main():
+    unittest.TextTestRunner(verbosity=2).run(suite())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the parsing runtime in grako.contexts and grako.parsing.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+import json
+import os
+import unittest
+from ..contexts import MemoCache, RuleMemoCache, ProfilingMemoCache, MemoFailure
+from ..exceptions import FailedParse, FailedToken, FailedCut, FailedMatch, FailedSemantics
+from ..buffering import Buffer
+from ..parsing import Parser, rule_def
+from ..bootstrap import GrakoParser, COMMENTS_RE
+from ..tool import genmodel
+from ..ast import CompactAST, TypedAST
+from ..semantics import GrakoSemantics
+
+THISDIR = os.path.dirname(os.path.abspath(__file__))
+BASEDIR = os.path.normpath(os.path.join(THISDIR, '../..'))
+
+WORDS_GRAMMAR = '''
+    start = {item}+ $ ;
+
+    @nomemo
+    item = word | number ;
+
+    word = ?/[a-z]+/? ;
+
+    number = ?/[0-9]+/? ;
+'''
+
+
+def generate_parser(model, name, inline=False):
+    code = compile(model.codegen(inline=inline), '<%s>' % name, 'exec')
+    namespace = dict(__name__=name)
+    exec(code, namespace)
+    return namespace[name + 'Parser']
+
+
+class MemoCacheTests(unittest.TestCase):
+    cache_class = MemoCache
+    rule = 'rule'
+    other = 'other'
+
+    def test_cut(self):
+        rule, other = self.rule, self.other
+        cache = self.cache_class()
+        for pos in (5, 1, 3, 3, 8):
+            cache.set(pos, rule, (None, pos))
+            cache.set(pos, other, (None, pos))
+        self.assertEqual(8, len(cache))
+        self.assertEqual((None, 3), cache.get(3, rule))
+        cache.cut(4)
+        self.assertEqual(4, len(cache))
+        self.assertIsNone(cache.get(3, rule))
+        self.assertEqual((None, 5), cache.get(5, other))
+        cache.set(2, rule, (None, 2))
+        cache.cut(6)
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get(2, rule))
+
+    def test_window_limit(self):
+        cache = self.cache_class(limit=4)
+        for pos in range(6):
+            cache.set(pos, self.rule, (None, pos))
+        self.assertEqual(4, len(cache))
+        self.assertEqual(2, cache.evictions)
+        self.assertIsNone(cache.get(1, self.rule))
+        self.assertEqual((None, 2), cache.get(2, self.rule))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_lru_limit(self):
+        cache = self.cache_class(limit=2, policy='lru')
+        for pos in range(3):
+            cache.set(pos, self.rule, (None, pos))
+            cache.get(0, self.rule)
+        self.assertEqual(2, len(cache))
+        self.assertEqual((None, 0), cache.get(0, self.rule))
+        self.assertIsNone(cache.get(1, self.rule))
+        cache.cut(3)
+        self.assertEqual(0, len(cache))
+
+
+class RuleMemoCacheTests(MemoCacheTests):
+    cache_class = RuleMemoCache
+    rule = 0
+    other = 3
+
+    def test_cut_stored_rules(self):
+        # a cut visits only the rules stored at the positions it discards
+        cache = self.cache_class(rules=100)
+        cache.set(1, 70, (None, 1))
+        cache.set(1, 2, (None, 1))
+        cache.set(2, 70, (None, 2))
+        cache._rules[5] = None
+        cache.cut(2)
+        self.assertEqual(1, len(cache))
+        self.assertEqual((None, 2), cache.get(2, 70))
+        self.assertIsNone(cache.get(1, 2))
+
+
+class ParsingTests(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(BASEDIR, 'etc/grako.ebnf')) as f:
+            self.text = f.read()
+
+    def test_memo_is_cleared(self):
+        parser = GrakoParser('Grako')
+        parser.parse(self.text)
+        self.assertEqual(0, len(parser._memoization_cache))
+
+    def test_memo_limit(self):
+        expected = GrakoParser('Grako').parse(self.text)
+        for policy in MemoCache.POLICIES:
+            parser = GrakoParser('Grako', memo_limit=10, memo_policy=policy)
+            self.assertEqual(expected, parser.parse(self.text))
+
+    def test_memo_failure(self):
+        parser = Parser()
+        parser._reset_context(Buffer('abc'))
+        failure = parser._memo_failure(FailedCut(parser._failure(FailedToken, 'x', 2)))
+        self.assertEqual(MemoFailure(FailedToken, 2, 'x', True), failure)
+        try:
+            parser._raise_memo_failure(failure)
+        except FailedCut as e:
+            self.assertEqual((2, 'x'), (e.nested.pos, e.nested.token))
+        failure = parser._memo_failure(parser._failure(FailedToken, 'y'))
+        self.assertEqual(MemoFailure(FailedToken, 0, 'y', False), failure)
+
+        # failures raised by rules are memoized as they are
+        class Matches(Parser):
+            @rule_def
+            def start(self):
+                with self._choice():
+                    with self._option():
+                        self.no()
+                    with self._option():
+                        self.no()
+                    self._error('no option')
+
+            @rule_def
+            def no(self):
+                raise FailedMatch(self._buffer, 'no', 'n')
+
+        parser = Matches()
+        self.assertRaises(FailedParse, parser.parse, 'abc', 'start')
+        self.assertEqual(1, parser.memo_stats.hits)
+        failure = parser._memo_failure(FailedMatch(parser._buffer, 'no', 'n'))
+        with self.assertRaises(FailedMatch) as context:
+            parser._raise_memo_failure(failure)
+        self.assertEqual(('no', 'n'), (context.exception.name, context.exception.item))
+
+    def test_memo_store(self):
+        parser = GrakoParser('Grako')
+        expected = parser.parse(self.text)
+        # position buckets are keyed by name, rule dicts by id
+        self.assertEqual(parser._rule_names, parser._memo_keys)
+        parser = GrakoParser('Grako', memo_store='rule', memo_profile=True)
+        self.assertEqual(expected, parser.parse(self.text))
+        self.assertEqual(list(range(len(parser._rule_names))), parser._memo_keys)
+        self.assertTrue('rule' in parser.memo_profile.rules)
+        model = genmodel('Grako', self.text)
+        expected = model.parse(self.text, 'grammar', comments_re=COMMENTS_RE)
+        result = model.parse(self.text, 'grammar', comments_re=COMMENTS_RE, memo_store='rule')
+        self.assertEqual(expected, result)
+        with self.assertRaises(ValueError):
+            GrakoParser('Grako', memo_store='array')
+
+    def test_compact_ast(self):
+        model = genmodel('Grako', self.text)
+        Parser = generate_parser(model, 'Grako')
+        expected = Parser().parse(self.text, 'grammar', comments_re=COMMENTS_RE)
+        result = Parser(ast_type=CompactAST).parse(self.text, 'grammar', comments_re=COMMENTS_RE)
+        self.assertEqual(expected, result)
+        self.assertIsInstance(result[0], CompactAST)
+        expected = model.parse(self.text, 'grammar', comments_re=COMMENTS_RE)
+        result = model.parse(self.text, 'grammar', comments_re=COMMENTS_RE, ast_type=CompactAST)
+        self.assertEqual(expected, result)
+
+    def test_node_types(self):
+        model = genmodel('Grako', self.text)
+        code = model.codegen(nodes=True)
+        self.assertTrue("__slots__ = ('decorators', 'name', 'rhs')" in code)
+        self.assertFalse('@rule_node' in model.codegen())
+        namespace = dict(__name__='Grako')
+        exec(compile(code, '<Grako>', 'exec'), namespace)
+        Parser = namespace['GrakoParser']
+        self.assertIsNone(Parser.grammar.rule_info.node_type)  # @ overrides the AST
+        result = Parser().parse(self.text, 'grammar', comments_re=COMMENTS_RE)
+        self.assertIsInstance(result[0], namespace['RuleNode'])
+        self.assertIsInstance(result[0], TypedAST)
+        self.assertEqual('grammar', result[0].name)
+        self.assertFalse(hasattr(result[0], '__dict__'))
+        semantics = GrakoSemantics('Grako')
+        result = Parser().parse(self.text, 'grammar', comments_re=COMMENTS_RE, semantics=semantics)
+        self.assertEqual(str(model), str(result))
+
+        # a rule whose names didn't match returns its CST, as with AST
+        model = genmodel('Optional', "start = (a:'x' | 'y') ';' ;")
+        namespace = dict(__name__='Optional')
+        exec(compile(model.codegen(nodes=True), '<Optional>', 'exec'), namespace)
+        Parser = namespace['OptionalParser']
+        self.assertIsNotNone(Parser.start.rule_info.node_type)
+        self.assertEqual(['y', ';'], Parser().parse('y;', 'start'))
+        self.assertEqual(namespace['StartNode'](a='x'), Parser().parse('x;', 'start'))
+
+        # the generated main() prints the nodes as JSON
+        code = model.codegen(nodes=True)
+        self.assertLess(code.index('from grako.ast import TypedAST'), code.index('PATTERNS.register'))
+        self.assertTrue('json.dumps(ast, indent=2, default=TypedAST.asjson)' in code)
+        result = Parser().parse('x;', 'start')
+        self.assertEqual('{"a": "x"}', json.dumps(result, default=TypedAST.asjson))
+
+    def test_recognize(self):
+        model = genmodel('Grako', self.text)
+        Parser = generate_parser(model, 'Grako')
+        parser = Parser()
+        self.assertTrue(parser.recognize(self.text, 'grammar', comments_re=COMMENTS_RE))
+        self.assertIs(Parser, type(parser))
+        self.assertTrue(model.recognize(self.text, 'grammar', comments_re=COMMENTS_RE))
+        bad = self.text + '\nrule = ;\n'
+        with self.assertRaises(FailedParse) as expected:
+            parser.parse(bad, 'grammar', comments_re=COMMENTS_RE)
+        with self.assertRaises(FailedParse) as failed:
+            parser.recognize(bad, 'grammar', comments_re=COMMENTS_RE)
+        self.assertEqual(expected.exception.pos, failed.exception.pos)
+
+        code = model.codegen(recognizer=True)
+        self.assertFalse('self.ast' in code)
+        namespace = dict(__name__='Grako')
+        exec(compile(code, '<Grako>', 'exec'), namespace)
+        parser = namespace['GrakoParser']()
+        self.assertIsNone(parser.parse(self.text, 'grammar', comments_re=COMMENTS_RE))
+        self.assertTrue(parser.recognize(self.text, 'grammar', comments_re=COMMENTS_RE))
+
+    def test_codegen_modes(self):
+        # the modes of codegen() don't stay set on the model
+        model = genmodel('Grako', self.text)
+        for kwargs in (dict(inline=True), dict(nodes=True), dict(recognizer=True)):
+            model.codegen(**kwargs)
+            code = model.render()
+            self.assertTrue('class GrakoParser(Parser):' in code)
+            self.assertTrue('self.ast[' in code)
+            self.assertFalse('_enter_option' in code)
+            self.assertFalse('TypedAST' in code)
+
+    def test_ast_only(self):
+        model = genmodel('Grako', self.text)
+        Parser = generate_parser(model, 'Grako')
+        self.assertTrue(Parser.rule.rule_info.named)
+        self.assertFalse(Parser.word.rule_info.named)
+        expected = Parser().parse(self.text, 'grammar', comments_re=COMMENTS_RE)
+        result = Parser(ast_only=True).parse(self.text, 'grammar', comments_re=COMMENTS_RE)
+        self.assertEqual(expected, result)
+
+        # a rule with named elements returns its AST even if none matched
+        model = genmodel('Optional', "start = a:'x' | 'y' ;")
+        Parser = generate_parser(model, 'Optional')
+        self.assertEqual('y', Parser().parse('y', 'start'))
+        self.assertEqual({}, Parser(ast_only=True).parse('y', 'start'))
+        self.assertEqual({}, model.parse('y', 'start', ast_only=True))
+
+        # nested expressions build a CST only if a named element reads it
+        grammar = '''
+            start = pairs:{pair}+ {',' tail+:word} $ ;
+            pair = '(' left:word {'.' word} [('-' | '+') right:word] ')' ;
+            word = ?/[a-z]+/? ;
+        '''
+        model = genmodel('Pairs', grammar)
+        text = '(a.b.c - d) (e) , f , g'
+        expected = model.parse(text, 'start')
+        self.assertEqual(expected, model.parse(text, 'start', ast_only=True))
+        for inline in (False, True):
+            built = {}
+
+            class Counting(generate_parser(model, 'Pairs', inline=inline)):
+                def _push_cst(self, cst=True):
+                    built[self.ast_only] = built.get(self.ast_only, 0) + bool(cst)
+                    super(Counting, self)._push_cst(cst)
+            for ast_only in (False, True):
+                result = Counting(ast_only=ast_only).parse(text, 'start')
+                self.assertEqual(expected, result)
+                self.assertEqual(['a', 'e'], [pair['left'] for pair in result['pairs']])
+            self.assertLess(built[True], built[False] / 2)
+
+    def test_ast_merge(self):
+        grammar = '''
+            start = {items+:item} $ ;
+            pairs = first:item {first+:item} $ ;
+            item = ?/[a-z]+/? ;
+        '''
+        model = genmodel('Merge', grammar)
+        Parser = generate_parser(model, 'Merge')
+        namespace = dict(__name__='Merge')
+        exec(compile(model.codegen(nodes=True), '<Merge>', 'exec'), namespace)
+        text = ' '.join(['ab'] * 100)
+        parsers = [Parser(), Parser(ast_type=CompactAST), namespace['MergeParser']()]
+        for parser in parsers:
+            self.assertEqual(['ab'] * 100, parser.parse(text, 'start')['items'])
+            self.assertEqual(['a', 'b', 'c'], parser.parse('a b c', 'pairs')['first'])
+        for ast_type in (None, CompactAST):
+            kwargs = dict(ast_type=ast_type) if ast_type else {}
+            self.assertEqual(['ab'] * 100, model.parse(text, 'start', **kwargs)['items'])
+            self.assertEqual(['a', 'b', 'c'], model.parse('a b c', 'pairs', **kwargs)['first'])
+
+    def test_nomemo(self):
+        model = genmodel('Words', WORDS_GRAMMAR)
+        self.assertFalse(model.rules[1].memoize)
+        self.assertTrue('@nomemo\nitem' in str(model))
+        self.assertTrue('@nomemo\n' in model.codegen())
+        text = 'abc 123 de 45'
+        expected = ['abc', '123', 'de', '45']
+        self.assertEqual(expected, model.parse(text, 'start'))
+
+        # start once, item 5 times, word 5 times, and number 3 times
+        Parser = generate_parser(model, 'Words')
+        for memoize, misses in [(None, 9), (True, 14), ({'word': False}, 4)]:
+            parser = Parser(memoize=memoize)
+            self.assertEqual(expected, parser.parse(text, 'start'))
+            self.assertEqual(misses, parser.memo_stats.misses)
+
+    def test_choice_protocol(self):
+        ctx = Parser()
+        ctx._reset_context(Buffer('b c'))
+        ctx._push_ast()
+        # a successful option marks its choice as done, without raising
+        with ctx._choice() as choice:
+            with ctx._option(choice):
+                ctx._token('a')
+            self.assertFalse(choice.done)
+            with ctx._option(choice):
+                ctx._token('b')
+            self.assertTrue(choice.done)
+        self.assertEqual('b', ctx.cst)
+        self.assertEqual(1, ctx._pos)
+
+        # without a choice, it raises OptionSucceeded to leave the choice
+        reached = []
+        with ctx._choice():
+            with ctx._option():
+                ctx._token('c')
+            reached.append(True)
+        self.assertEqual([], reached)
+        self.assertEqual(['b', 'c'], ctx.cst)
+
+        code = genmodel('Words', WORDS_GRAMMAR).codegen()
+        self.assertTrue('with self._option(choice0, ast=False, cst=False):' in code)
+        self.assertTrue('if not choice0.done:' in code)
+
+    def test_memo_profile(self):
+        grammar = '''
+            start = {item}+ $ ;
+            item = word '!' | word ;
+            word = ?/[a-z]+/? ;
+        '''
+        model = genmodel('Shout', grammar)
+        parser = generate_parser(model, 'Shout')(memo_profile=True)
+        parser.parse('ab! cd', 'start')
+        model.parse('ab! cd', 'start', memo_profile=parser.memo_profile)
+        word = parser.memo_profile.rules['word']
+        # the model doesn't memoize failures
+        self.assertEqual((3 + 2, 2 + 1), (word.stored, word.reused))
+        self.assertEqual(['item', 'start'], parser.memo_profile.nomemo_rules())
+        self.assertTrue('@nomemo' in parser.memo_profile.report())
+
+        # rule ids out of the range of the names are reported as numbers
+        stored = word.stored
+        cache = ProfilingMemoCache(parser.memo_profile, names=['word'])
+        cache.set(0, 0, (None, 0))
+        cache.set(0, 7, (None, 0))
+        self.assertEqual(stored + 1, word.stored)
+        self.assertEqual(1, parser.memo_profile.rules['7'].stored)
+        self.assertTrue('7' in parser.memo_profile.report())
+
+    def test_inline(self):
+        model = genmodel('Grako', self.text)
+        code = model.codegen(inline=True)
+        self.assertFalse('with self._' in code.replace('with self._if', ''))
+        expected = generate_parser(model, 'Grako')().parse(self.text, 'grammar', comments_re=COMMENTS_RE)
+        parser = generate_parser(model, 'Grako', inline=True)()
+        self.assertEqual(expected, parser.parse(self.text, 'grammar', comments_re=COMMENTS_RE))
+
+        # the cut in the optional makes 'a b d' fail
+        model = genmodel('Cut', "start = {'a' ['b' >> 'c']}+ 'b' 'd' $ ;")
+        for inline in (False, True):
+            parser = generate_parser(model, 'Cut', inline=inline)()
+            self.assertEqual(['a', ['b', 'c'], 'b', 'd'], parser.parse('a b c b d', 'start'))
+            self.assertRaises(FailedParse, parser.parse, 'a b d', 'start')
+
+    def test_unnamed_tries(self):
+        grammar = '''
+            start = {pair} ['x' word] (last:word | number) $ ;
+            pair = ('a' | 'b') ({'c' word}+ 'c' | number) ;
+            word = ?/[d-z]+/? ;
+            number = ?/[0-9]+/? ;
+        '''
+        model = genmodel('Pairs', grammar)
+        start = model.rules[0].exp
+        self.assertFalse(start.sequence[0]._named)
+        self.assertTrue(start.sequence[2]._named)
+        code = model.codegen()
+        self.assertTrue('self._closure(block0, ast=False, cst=False)' in code)
+        self.assertTrue('with self._optional(ast=False, cst=False):' in code)
+        self.assertTrue('self._enter_option(ast=False, cst=False)' in model.codegen(inline=True))
+
+        # the last iteration of the closure and the optional partly match,
+        # then backtrack
+        text = 'a c d c e c b 1 x'
+        expected = {'last': 'x'}
+        self.assertEqual(expected, model.parse(text, 'start'))
+        for inline in (False, True):
+            parser = generate_parser(model, 'Pairs', inline=inline)()
+            self.assertEqual(expected, parser.parse(text, 'start'))
+        self.assertEqual(['a', ['c', 'd', ['c', 'e'], 'c']], parser.parse('a c d c e c', 'pair'))
+
+    def test_dispatch(self):
+        grammar = '''
+            start = {stmt}+ $ ;
+            stmt = 'if' >> word | 'IN' word | [word] '.' | >> 'x' ;
+            word = ?/[a-z]+/? ;
+        '''
+        model = genmodel('Stmts', grammar)
+        stmt = model.rules[1].exp
+        self.assertEqual([{'i'}, {'i', 'I'}, None, None], stmt._option_chars)
+        self.assertTrue('if c0 in {\'I\', \'i\'}:' in model.codegen())
+
+        Parser = generate_parser(model, 'Stmts')
+        for text, ignorecase in [('if a IN b . c. x', False), ('IF a In b . x', True)]:
+            expected = model.parse(text, 'start', ignorecase=ignorecase)
+            self.assertEqual(expected, Parser().parse(text, 'start', ignorecase=ignorecase))
+        self.assertRaises(FailedParse, model.parse, 'if IN', 'start')
+        self.assertRaises(FailedParse, Parser().parse, 'if IN', 'start')
+
+    def test_failures_are_copied(self):
+        model = genmodel('Words', WORDS_GRAMMAR)
+        parser = generate_parser(model, 'Words')()
+        try:
+            parser.parse('abc 12 ?', 'start')
+        except FailedParse as e:
+            failure = e
+        self.assertFalse(failure.shared)
+        self.assertEqual(7, failure.pos)
+        message = str(failure)
+        self.assertRaises(FailedParse, parser.parse, '?', 'start')
+        self.assertEqual(7, failure.pos)
+        self.assertEqual(message, str(failure))
+        # the failures reused during a parse don't keep its buffer alive
+        parser.parse('abc 12', 'start')
+        self.assertEqual({}, parser._failures)
+        parser._failure(FailedToken, 'x')
+        parser._reset_context(Buffer('x'))
+        self.assertEqual({}, parser._failures)
+
+        self.assertRaises(FailedParse, model.parse, '?', 'item')
+        try:
+            model.parse('?', 'item')
+        except FailedParse as e:
+            self.assertFalse(e.shared)
+            self.assertTrue("one of {" in str(e))
+            self.assertTrue("'[a-z]+'" in str(e))
+
+    def test_rule_table(self):
+        Parser = generate_parser(genmodel('Words', WORDS_GRAMMAR), 'Words')
+        infos, ids = Parser._rule_table()
+        self.assertEqual(['item', 'number', 'start', 'word'], [info.name for info in infos])
+        self.assertEqual([0, 1, 2, 3], [ids[info] for info in infos])
+        self.assertFalse(infos[0].memoize)
+        self.assertIs(infos, Parser._rule_table()[0])
+
+        class MoreWords(Parser):
+            @rule_def
+            def blank(self):
+                self._token(' ')
+
+        infos = MoreWords._rule_table()[0]
+        self.assertEqual(['blank', 'item', 'number', 'start', 'word'], [info.name for info in infos])
+
+        # an override calling the rule it overrides
+        Base = generate_parser(genmodel('Base', "start = a $ ; a = 'x' ;"), 'Base')
+
+        class Sub(Base):
+            @rule_def
+            def a(self):
+                super(Sub, self).a()
+                self._token(';')
+
+        infos = Sub._rule_table()[0]
+        self.assertEqual(['a', 'a', 'start'], [info.name for info in infos])
+        self.assertEqual(['x', ';'], Sub().parse('x;', 'a'))
+
+        class Semantics(object):
+            lookups = 0
+
+            def __getattr__(self, name):
+                Semantics.lookups += 1
+                return lambda ast: ast
+
+        parser = Parser()
+        parser.parse('abc 123 de 45', 'start', semantics=Semantics())
+        self.assertEqual(4, Semantics.lookups)
+
+    def test_defer_semantics(self):
+        grammar = '''
+            start = {stmt}+ $ ;
+            stmt = pair ';' | word word '!' ;
+            pair = word word ;
+            word = ?/[a-z]+/? ;
+        '''
+
+        class Semantics(object):
+            def __init__(self):
+                self.calls = []
+
+            def pair(self, ast):
+                self.calls.append('pair')
+                return tuple(ast)
+
+            def word(self, ast):
+                self.calls.append(ast)
+                if ast == 'bad':
+                    raise FailedSemantics('bad word')
+                return ast.upper()
+
+        model = genmodel('Stmts', grammar)
+        Parser = generate_parser(model, 'Stmts')
+        text = 'a b ! c d ;'
+        expected = ['A', 'B', '!', [('C', 'D'), ';']]
+        for parse in (model.parse, lambda *args, **kw: Parser(**kw).parse(*args)):
+            semantics = Semantics()
+            self.assertEqual(expected, parse(text, 'start', semantics=semantics))
+            self.assertEqual(['a', 'b', 'pair', 'c', 'd', 'pair'], semantics.calls)
+
+            # the pair a b is dropped, and each word reused, not run again
+            semantics = Semantics()
+            self.assertEqual(expected, parse(text, 'start', semantics=semantics, defer_semantics=True))
+            self.assertEqual(['a', 'b', 'c', 'd', 'pair'], semantics.calls)
+
+            # a failed action fails the parse, where the rule ended
+            with self.assertRaises(FailedParse) as context:
+                parse('a bad !', 'start', semantics=Semantics(), defer_semantics=True)
+            self.assertEqual(5, context.exception.pos)
+            self.assertTrue('bad word' in str(context.exception))
+
+
+def suite():
+    loader = unittest.TestLoader()
+    return unittest.TestSuite([loader.loadTestsFromTestCase(MemoCacheTests),
+                               loader.loadTestsFromTestCase(RuleMemoCacheTests),
+                               loader.loadTestsFromTestCase(ParsingTests)])
+
+
+def main():
+    unittest.TextTestRunner(verbosity=2).run(suite())
+
+if __name__ == '__main__':
+    main()
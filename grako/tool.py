@@ -44,6 +44,14 @@ argparser.add_argument('-d', '--draw',
                        help='generate a diagram of the grammar',
                        action='store_true'
                        )
+argparser.add_argument('-i', '--inline',
+                       help='generate straight-line code instead of context managers',
+                       action='store_true'
+                       )
+argparser.add_argument('-n', '--nodes',
+                       help='generate a node class for each rule with named elements',
+                       action='store_true'
+                       )
 
 
 def genmodel(name, grammar, trace=False, filename=None):
@@ -51,9 +59,9 @@ def genmodel(name, grammar, trace=False, filename=None):
     return parser.parse(grammar, filename=filename)
 
 
-def gencode(name, grammar, trace=False, filename=None):
+def gencode(name, grammar, trace=False, filename=None, inline=False, nodes=False):
     model = genmodel(name, grammar, trace=trace, filename=filename)
-    return model.render()
+    return model.codegen(inline=inline, nodes=nodes)
 
 
 def main():
@@ -100,7 +108,7 @@ def main():
         if binary:
             parser = pickle.dumps(model, protocol=2)
         else:
-            parser = model.render()
+            parser = model.codegen(inline=args.inline, nodes=args.nodes)
 
         if draw:
             from . import diagrams